@@ -1,25 +1,270 @@
+import asyncio
+import contextlib
 import os
-from datetime import timedelta
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import datetime, timedelta
+from io import BytesIO
 from typing import List
 
 import discord
 from discord.commands import option
-from discord.ext import commands
-from generic import logger
+from discord.ext import commands, tasks
 from ollama import AsyncClient
+from PIL import Image, UnidentifiedImageError
+
+from autocomplete import Autocompleter
+from generic import logger
 
 ollama = AsyncClient(os.getenv("OLLAMA_URL"))
 
-TOO_LONG_MSG = " **[MESSAGE TOO LONG]**"
+DEFAULT_MODEL = "llama2-uncensored"
+VISION_MODEL = "llava"
+CONTEXT_WINDOW = timedelta(minutes=10)
+CONTEXT_LIMIT = 100
+# Anything bigger gets downscaled before being sent to the vision model
+MAX_IMAGE_SIZE = 1024
+MAX_CONCURRENT_FETCHES = 4
+
+# How many generations Ollama gets to run at the same time
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY") or 1)
+# How many jobs for the loaded model may skip the queue in a row
+MODEL_BATCH_LIMIT = 4
+
+MAX_MESSAGE_LENGTH = 2000
+# Discord allows 5 message edits per 5 seconds per channel
+EDIT_INTERVAL = 1.5
+
+
+class ModelCatalogue:
+	"""
+	TTL cache of the models available on the Ollama server
+
+	Stale entries are still served while a refresh runs in the background,
+	so only the very first lookup has to wait for Ollama.
+	"""
+
+	def __init__(self, ttl: float = 300):
+		self.ttl = ttl
+		self._models: list[str] = []
+		self._fetched_at: float | None = None
+		self._refresh_task: asyncio.Task | None = None
+		self._lock = asyncio.Lock()
+
+	@property
+	def stale(self) -> bool:
+		return (
+			self._fetched_at is None or time.monotonic() - self._fetched_at > self.ttl
+		)
+
+	async def refresh(self) -> list[str]:
+		async with self._lock:
+			response = await ollama.list()
+			self._models = [model.model for model in response.models]
+			self._fetched_at = time.monotonic()
+		return self._models
+
+	async def get(self) -> list[str]:
+		"""Get the full model names (e.g. `llava:latest`)"""
+		if self._fetched_at is None:
+			return await self.refresh()
+		if self.stale and not self._refresh_task:
+			self._refresh_task = asyncio.create_task(self.refresh())
+			self._refresh_task.add_done_callback(self._refresh_done)
+		return self._models
+
+	def _refresh_done(self, task: asyncio.Task):
+		self._refresh_task = None
+		if not task.cancelled() and (error := task.exception()):
+			logger.warning("Failed to refresh the Ollama models: %s", error)
+
+	async def names(self) -> list[str]:
+		"""Get the model names without tag (e.g. `llava`)"""
+		return [model.split(":")[0] for model in await self.get()]
+
+
+MODELS = ModelCatalogue()
+
+
+def split_message(text: str) -> list[str]:
+	"""Split text into chunks that fit in a Discord message, preferably on a newline"""
+	pages = []
+	while len(text) > MAX_MESSAGE_LENGTH:
+		cut = text.rfind("\n", 0, MAX_MESSAGE_LENGTH)
+		if cut <= 0:
+			cut = text.rfind(" ", 0, MAX_MESSAGE_LENGTH)
+		if cut <= 0:
+			cut = MAX_MESSAGE_LENGTH
+		pages.append(text[:cut])
+		text = text[cut:].lstrip()
+	pages.append(text)
+	return pages
+
+
+class QueuedJob:
+	def __init__(self, user_id: int, model: str):
+		self.user_id = user_id
+		self.model = model
+		self.started: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+
+class OllamaScheduler:
+	"""
+	Concurrency limiter with per-user fair queuing in front of Ollama
+
+	Users are served round-robin so one user can't starve the rest. Jobs
+	for the model that was used last may skip ahead (up to
+	MODEL_BATCH_LIMIT in a row) to avoid Ollama swapping models.
+	"""
+
+	def __init__(self, concurrency: int = OLLAMA_CONCURRENCY):
+		self.concurrency = concurrency
+		self._running = 0
+		self._queues: OrderedDict[int, deque[QueuedJob]] = OrderedDict()
+		self._model: str | None = None
+		self._batch = 0
+
+	def position(self, job: QueuedJob) -> int:
+		"""Estimate the position of a job in the queue (1 is next)"""
+		index = self._queues[job.user_id].index(job)
+		ahead = index
+		before = True
+		for user_id, queue in self._queues.items():
+			if user_id == job.user_id:
+				before = False
+				continue
+			# Users earlier in the round-robin are served once more before this job
+			ahead += min(len(queue), index + 1 if before else index)
+		return ahead + 1
+
+	@contextlib.asynccontextmanager
+	async def slot(
+		self,
+		user_id: int,
+		model: str,
+		notify: Callable[[int], Awaitable[None]] | None = None,
+	) -> AsyncIterator[None]:
+		"""Wait for a free slot, calling notify with the queue position if queued"""
+		job = QueuedJob(user_id, model)
+		self._queues.setdefault(user_id, deque()).append(job)
+		self._dispatch()
+		if not job.started.done():
+			try:
+				if notify:
+					try:
+						await notify(self.position(job))
+					except discord.DiscordException as error:
+						# A failed notification shouldn't cost the user their turn
+						logger.warning("Failed to send the queue position: %s", error)
+				await job.started
+			except BaseException:
+				if job.started.done() and not job.started.cancelled():
+					self._release()
+				else:
+					self._remove(job)
+				raise
+		try:
+			yield
+		finally:
+			self._release()
+
+	def _release(self):
+		self._running -= 1
+		self._dispatch()
+
+	def _remove(self, job: QueuedJob):
+		queue = self._queues.get(job.user_id)
+		if queue and job in queue:
+			queue.remove(job)
+			if not queue:
+				del self._queues[job.user_id]
+
+	def _dispatch(self):
+		while self._running < self.concurrency and (job := self._next()):
+			self._running += 1
+			job.started.set_result(None)
+
+	def _next(self) -> QueuedJob | None:
+		if not self._queues:
+			return None
+		heads = [queue[0] for queue in self._queues.values()]
+		job = None
+		if self._batch < MODEL_BATCH_LIMIT:
+			job = next((job for job in heads if job.model == self._model), None)
+		if job is None:
+			job = heads[0]
+
+		# Move the user to the back of the line
+		queue = self._queues.pop(job.user_id)
+		queue.popleft()
+		if queue:
+			self._queues[job.user_id] = queue
+
+		self._batch = self._batch + 1 if job.model == self._model else 1
+		self._model = job.model
+		return job
+
+
+SCHEDULER = OllamaScheduler()
+
+
+class StreamedReply:
+	"""
+	Progressively edits Discord messages with a streamed AI response
+
+	The first message is sent as soon as the first token arrives, after
+	that edits are throttled to EDIT_INTERVAL. Responses longer than
+	MAX_MESSAGE_LENGTH continue in follow-up messages.
+	"""
+
+	def __init__(self, send: Callable[[str], Awaitable[discord.Message]]):
+		self.send = send
+		self.text = ""
+		self.messages: list[discord.Message] = []
+		self._sent: list[str] = []
+		self._started = time.monotonic()
+		self._last_flush = 0.0
+
+	async def feed(self, chunk: str):
+		self.text += chunk
+		if not self.text.strip():
+			return
+		if not self.messages:
+			logger.debug(
+				"First AI token after %.2f seconds", time.monotonic() - self._started
+			)
+			await self.flush()
+		elif time.monotonic() - self._last_flush >= EDIT_INTERVAL:
+			await self.flush()
+
+	async def flush(self):
+		self._last_flush = time.monotonic()
+		for index, page in enumerate(split_message(self.text.strip())):
+			if index >= len(self.messages):
+				self.messages.append(await self.send(page))
+				self._sent.append(page)
+			elif self._sent[index] != page:
+				await self.messages[index].edit(content=page)
+				self._sent[index] = page
+
+	async def finish(self):
+		if self.text.strip():
+			await self.flush()
+		else:
+			await self.send("_No response from AI_")
+		logger.debug(
+			"AI response of %s characters took %.2f seconds",
+			len(self.text),
+			time.monotonic() - self._started,
+		)
 
 
 async def download_ai_models(models: List[str]):
 	"""Download the AI models from the Ollama server."""
-	downloaded_models = await ollama.list()
+	downloaded_models = await MODELS.refresh()
 	for model in models.copy():
-		if any(
-			m.model.replace(":latest", "") == model for m in downloaded_models.models
-		):
+		if any(m.replace(":latest", "") == model for m in downloaded_models):
 			models.remove(model)
 	if not models:
 		return
@@ -27,22 +272,153 @@ async def download_ai_models(models: List[str]):
 	for model in models:
 		logger.debug("Downloading %s...", model)
 		await ollama.pull(model=model)
+	await MODELS.refresh()
 
 
-async def autocomplete_models(ctx: discord.AutocompleteContext):
+async def fetch_models(ctx: discord.AutocompleteContext):
 	"""Autocomplete the AI models from the Ollama server."""
-	models = await ollama.list()
+	return [discord.OptionChoice(model) for model in await MODELS.names()]
+
+
+autocomplete_models = Autocompleter("models", fetch_models, exhaustive=True, ttl=60)
+
+
+def shrink_image(image: bytes) -> bytes:
+	"""
+	Downscale an image to fit in MAX_IMAGE_SIZE, re-encoding it as PNG.
+	Returns nothing for images that are too large to decode.
+	"""
+	try:
+		with Image.open(BytesIO(image)) as img:
+			if max(img.size) <= MAX_IMAGE_SIZE:
+				return image
+			img.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE))
+			output = BytesIO()
+			img.save(output, format="PNG", optimize=True)
+			return output.getvalue()
+	except Image.DecompressionBombError as error:
+		logger.warning("Skipping an image: %s", error)
+		return b""
+	except (UnidentifiedImageError, OSError):
+		return image
+
+
+class ImageCache:
+	"""LRU cache of downloaded (and downscaled) images, keyed by id"""
+
+	def __init__(self, capacity: int = 256):
+		self.capacity = capacity
+		self._images: OrderedDict[int, bytes] = OrderedDict()
+		self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+	async def read(self, asset: discord.Attachment | discord.StickerItem) -> bytes:
+		if (image := self._images.get(asset.id)) is not None:
+			self._images.move_to_end(asset.id)
+			return image
+		async with self._semaphore:
+			image = await asset.read()
+		image = await asyncio.to_thread(shrink_image, image)
+		self._images[asset.id] = image
+		if len(self._images) > self.capacity:
+			self._images.popitem(last=False)
+		return image
+
+
+IMAGES = ImageCache()
+
+
+def get_image_assets(
+	message: discord.Message,
+) -> list[discord.Attachment | discord.StickerItem]:
+	return [
+		sticker
+		for sticker in message.stickers
+		if sticker.format.name in ("png", "apng")
+	] + [
+		attachment
+		for attachment in message.attachments
+		if attachment.content_type and attachment.content_type.startswith("image")
+	]
+
+
+async def read_images(messages: list[discord.Message]) -> list[list[bytes]]:
+	"""Fetch the images of several messages concurrently"""
+	assets = [get_image_assets(message) for message in messages]
+	flat = [asset for message_assets in assets for asset in message_assets]
+	if not flat:
+		return [[] for _ in messages]
+
+	started = time.monotonic()
+	images = iter(await asyncio.gather(*(IMAGES.read(asset) for asset in flat)))
+	logger.debug(
+		"Fetched %s images in %.2f seconds", len(flat), time.monotonic() - started
+	)
+	# Skipped images are empty
 	return [
-		discord.OptionChoice(model.model.split(":")[0])
-		for model in models.models
-		if ctx.value in model.model.split(":")[0]
+		[image for _ in message_assets if (image := next(images))]
+		for message_assets in assets
 	]
 
 
+class Conversation:
+	"""
+	Rolling conversation buffer of a single channel
+
+	Kept up to date from on_message, so building a prompt only has to
+	expire old messages instead of re-reading the channel history.
+	"""
+
+	def __init__(self):
+		self.messages: deque[tuple[datetime, dict]] = deque(maxlen=CONTEXT_LIMIT)
+		self._model: tuple[datetime, str] | None = None
+
+	def expire(self, now: datetime):
+		cutoff = now - CONTEXT_WINDOW
+		while self.messages and self.messages[0][0] < cutoff:
+			self.messages.popleft()
+		if self._model and self._model[0] < cutoff:
+			self._model = None
+
+	def add(self, created_at: datetime, message: dict):
+		self.messages.append((created_at, message))
+
+	def clear(self):
+		self.messages.clear()
+		self._model = None
+
+	def __bool__(self) -> bool:
+		return bool(self.messages or self._model)
+
+	def set_model(self, created_at: datetime, model: str):
+		self._model = (created_at, model)
+
+	@property
+	def model(self) -> str:
+		return self._model[1] if self._model else DEFAULT_MODEL
+
+	def prompt(self) -> list[dict]:
+		return [message for _, message in self.messages]
+
+
 class AICog(commands.Cog):
 	def __init__(self, bot: discord.Bot):
 		self.bert = bot
 		self._models_downloaded = False
+		self._conversations: dict[int, Conversation] = {}
+		self._loading: dict[int, asyncio.Task[Conversation]] = {}
+		self.expire_conversations.start()
+
+	def cog_unload(self):
+		self.expire_conversations.cancel()
+
+	@tasks.loop(minutes=10)
+	async def expire_conversations(self):
+		"""Forget the conversations of channels that have gone quiet"""
+		now = discord.utils.utcnow()
+		for channel_id, conversation in list(self._conversations.items()):
+			conversation.expire(now)
+			if not conversation:
+				del self._conversations[channel_id]
 
 	@commands.slash_command(
 		integration_types={
@@ -51,28 +427,39 @@ class AICog(commands.Cog):
 		}
 	)
 	@option("prompt", description="The prompt to give to the AI")
-	@option("model", description="The model to use", autocomplete=autocomplete_models)
+	@option(
+		"model",
+		description="The model to use",
+		autocomplete=autocomplete_models.complete,
+	)
 	async def ai(
 		self, ctx: discord.ApplicationContext, prompt: str, model: str = "llama3.2"
 	):
 		"""Bert AI Technologies Ltd."""
 		await ctx.defer()
-		ai_response = await ollama.generate(model, prompt)
-		if response := ai_response.response:
-			if len(response) > 2000:
-				await ctx.send_followup(
-					response[: 2000 - len(TOO_LONG_MSG)] + TOO_LONG_MSG
-				)
-			else:
-				await ctx.send_followup(response)
-		else:
-			await ctx.send_followup("_No response from AI_")
+
+		async def notify(position: int):
+			await ctx.interaction.edit_original_response(
+				content=f"_You're number {position} in the queue_"
+			)
+
+		async def send(content: str) -> discord.Message:
+			# The first page replaces the deferred (or queued) response
+			if not reply.messages:
+				return await ctx.interaction.edit_original_response(content=content)
+			return await ctx.send_followup(content)
+
+		reply = StreamedReply(send)
+		async with SCHEDULER.slot(ctx.author.id, model, notify):
+			async for chunk in await ollama.generate(model, prompt, stream=True):
+				await reply.feed(chunk.response)
+		await reply.finish()
 
 	@commands.Cog.listener()
 	async def on_ready(self):
 		if not self._models_downloaded:
 			# To avoid checking when Discord reconnects due to network issues
-			await download_ai_models(["llama2-uncensored", "llava"])
+			await download_ai_models([DEFAULT_MODEL, VISION_MODEL])
 			self._models_downloaded = True
 
 	@commands.Cog.listener()
@@ -83,35 +470,21 @@ class AICog(commands.Cog):
 		) or message.author.bot:
 			return
 
-		available_models = [
-			model.model.split(":")[0] for model in (await ollama.list()).models
-		]
-		model = "llama2-uncensored"
+		conversation = await self.get_conversation(message)
+		conversation.expire(message.created_at)
 
 		if message.content == "bert clear":
+			conversation.clear()
 			await message.channel.send("Understood. ||bert-ignore||")
 			return
 
 		if message.content.startswith("bert model"):
 			if len(message.content.split(" ")) == 2:
-				history = await message.channel.history(
-					limit=100,
-					before=message.created_at,
-					after=message.created_at - timedelta(minutes=10),
-				).flatten()
-				history.reverse()
-				for msg in history:
-					if "bert-ignore" not in msg.content and not msg.author.bot:
-						if msg.content == "bert clear":
-							break
-						if (
-							msg.content.startswith("bert model ")
-							and msg.content.split(" ")[2] in available_models
-						):
-							model = msg.content.split(" ")[2]
-							break
-				await message.channel.send(f"Current model is {model}. ||bert-ignore||")
-			elif (model := message.content.split(" ")[2]) in available_models:
+				await message.channel.send(
+					f"Current model is {conversation.model}. ||bert-ignore||"
+				)
+			elif (model := message.content.split(" ")[2]) in await MODELS.names():
+				conversation.set_model(message.created_at, model)
 				await message.channel.send(f"Model set to {model}. ||bert-ignore||")
 			else:
 				await message.channel.send(
@@ -120,62 +493,101 @@ class AICog(commands.Cog):
 			return
 
 		async with message.channel.typing():
-			images = []
-			for sticker in message.stickers:
-				if sticker.format.name in ("png", "apng"):
-					images.append(await sticker.read())
-			for attachment in message.attachments:
-				if attachment.content_type.startswith("image"):
-					images.append(await attachment.read())
-
-			messages = []
-			history = await message.channel.history(
-				limit=100,
-				before=message.created_at,
-				after=message.created_at - timedelta(minutes=10),
-				oldest_first=True,
-			).flatten()
-			for msg in history:
-				if "bert-ignore" not in msg.content:
-					if msg.author.bot:
-						if msg.author == self.bert.user:
-							messages.append(
-								{"role": "assistant", "content": msg.content}
-							)
-					elif msg.content == "bert clear":
-						messages.clear()
-					elif msg.content.startswith("bert model "):
-						if msg.content.split(" ")[2] in available_models:
-							model = msg.content.split(" ")[2]
-					else:
-						images_ = []
-						for sticker in msg.stickers:
-							if sticker.format.name in ("png", "apng"):
-								images_.append(await sticker.read())
-						for attachment in msg.attachments:
-							if attachment.content_type.startswith("image"):
-								images_.append(await attachment.read())
-
-						messages.append(
-							{"role": "user", "content": msg.content, "images": images_}
-						)
-			messages.append(
-				{"role": "user", "content": message.content, "images": images}
-			)
+			(images,) = await read_images([message])
+			user_message = {
+				"role": "user",
+				"content": message.content,
+				"images": images,
+			}
+			# Like in load_history, bert-ignore messages are answered but not remembered
+			remember = "bert-ignore" not in message.content
+			if remember:
+				conversation.add(message.created_at, user_message)
+
+			model = VISION_MODEL if images else conversation.model
+			queued: discord.Message | None = None
+
+			async def notify(position: int):
+				nonlocal queued
+				queued = await message.reply(
+					f"_You're number {position} in the queue_ ||bert-ignore||",
+					mention_author=False,
+				)
+
+			reply = StreamedReply(message.channel.send)
+			async with SCHEDULER.slot(message.author.id, model, notify):
+				if queued:
+					with contextlib.suppress(discord.HTTPException):
+						await queued.delete()
+				prompt = conversation.prompt()
+				if not remember:
+					prompt.append(user_message)
+				async for chunk in await ollama.chat(
+					model, messages=prompt, stream=True
+				):
+					await reply.feed(chunk.message.content or "")
+			await reply.finish()
 
-			ai_reply = await ollama.chat(
-				"llava" if images else model, messages=messages
+		if reply.text.strip() and "bert-ignore" not in reply.text:
+			conversation.add(
+				reply.messages[-1].created_at,
+				{"role": "assistant", "content": reply.text.strip()},
 			)
 
-			if response := ai_reply.message.content:
-				if len(response) > 2000:
-					await message.channel.send(
-						response[: 2000 - len(TOO_LONG_MSG)] + TOO_LONG_MSG
-					)
-				else:
-					await message.channel.send(response)
+	async def get_conversation(self, message: discord.Message) -> Conversation:
+		"""Get the conversation of a channel, loading it from history if needed"""
+		channel_id = message.channel.id
+		if (conversation := self._conversations.get(channel_id)) is not None:
+			return conversation
+		if channel_id not in self._loading:
+			self._loading[channel_id] = asyncio.create_task(self.load_history(message))
+		try:
+			conversation = await asyncio.shield(self._loading[channel_id])
+		finally:
+			self._loading.pop(channel_id, None)
+		self._conversations[channel_id] = conversation
+		return conversation
+
+	async def load_history(self, message: discord.Message) -> Conversation:
+		"""Rebuild a conversation from the channel history (cold start only)"""
+		conversation = Conversation()
+		available_models = await MODELS.names()
+		history = await message.channel.history(
+			limit=CONTEXT_LIMIT,
+			before=message.created_at,
+			after=message.created_at - CONTEXT_WINDOW,
+			oldest_first=True,
+		).flatten()
+		entries: list[tuple[str, discord.Message]] = []
+		for msg in history:
+			if "bert-ignore" in msg.content:
+				continue
+			if msg.author.bot:
+				if msg.author == self.bert.user:
+					entries.append(("assistant", msg))
+			elif msg.content == "bert clear":
+				entries.clear()
+				conversation.clear()
+			elif msg.content.startswith("bert model "):
+				if (model := msg.content.split(" ")[2]) in available_models:
+					conversation.set_model(msg.created_at, model)
+			else:
+				entries.append(("user", msg))
+
+		# Only fetch the images of messages that survived a "bert clear"
+		user_messages = [msg for role, msg in entries if role == "user"]
+		images = iter(await read_images(user_messages))
+		for role, msg in entries:
+			if role == "assistant":
+				conversation.add(
+					msg.created_at, {"role": "assistant", "content": msg.content}
+				)
 			else:
-				await message.channel.send("_No response from AI_")
+				conversation.add(
+					msg.created_at,
+					{"role": "user", "content": msg.content, "images": next(images)},
+				)
+		return conversation
 
 
 def setup(bot: discord.Bot):
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Awaitable, Callable
+from difflib import SequenceMatcher
+
+import discord
+
+from generic import logger
+
+# Discord shows at most 25 choices
+MAX_CHOICES = 25
+# Discord drops autocomplete responses after 3 seconds
+LATENCY_BUDGET = 2.5
+
+Choices = list[discord.OptionChoice]
+
+
+def filter_choices(choices: Choices, query: str) -> Choices:
+	query = query.lower()
+	return [choice for choice in choices if query in choice.name.lower()]
+
+
+def fuzzy_filter_choices(choices: Choices, query: str) -> Choices:
+	"""Like filter_choices, but also keeps close matches, best matches first"""
+	if not query:
+		return choices
+	query = query.lower()
+	scored = []
+	for choice in choices:
+		name = choice.name.lower()
+		if name.startswith(query):
+			score = 3.0
+		elif query in name:
+			score = 2.0
+		else:
+			score = SequenceMatcher(None, query, name).ratio()
+		if score >= 0.5:
+			scored.append((score, choice))
+	scored.sort(key=lambda scored_choice: scored_choice[0], reverse=True)
+	return [choice for _, choice in scored]
+
+
+class Autocompleter:
+	"""
+	Cached, debounced autocomplete source that can be shared across commands
+
+	There are two kinds of sources:
+	- exhaustive sources return every possible choice at once (e.g. the
+	  playlists of a user), those are fetched once per scope and filtered
+	  locally on every keystroke
+	- search sources are queried per keystroke, those are debounced per
+	  user, superseded keystrokes are cancelled and results of a shorter
+	  prefix are filtered locally and returned if the source doesn't
+	  answer within the latency budget
+
+	Hit, partial and miss counts are kept in `stats`.
+	"""
+
+	def __init__(
+		self,
+		name: str,
+		fetch: Callable[[discord.AutocompleteContext], Awaitable[Choices]],
+		*,
+		exhaustive: bool = False,
+		per_user: bool = False,
+		matcher: Callable[[Choices, str], Choices] = filter_choices,
+		min_length: int = 0,
+		debounce: float = 0.3,
+		ttl: float = 300,
+		capacity: int = 512,
+	):
+		self.name = name
+		self.fetch = fetch
+		self.exhaustive = exhaustive
+		self.per_user = per_user
+		self.matcher = matcher
+		self.min_length = min_length
+		self.debounce = debounce
+		self.ttl = ttl
+		self.capacity = capacity
+		self.stats: Counter[str] = Counter()
+		self._cache: OrderedDict[tuple[int | None, str], tuple[float, Choices]] = (
+			OrderedDict()
+		)
+		self._inflight: dict[tuple[int | None, str], asyncio.Task[Choices]] = {}
+		self._latest: dict[int, asyncio.Task[Choices]] = {}
+
+	@property
+	def hit_rate(self) -> float:
+		total = sum(self.stats.values())
+		return (self.stats["hit"] + self.stats["partial"]) / total if total else 0
+
+	def invalidate(self, scope: int | None = None):
+		"""Drop the cached choices of a scope (a user id, or None if not per user)"""
+		for key in [key for key in self._cache if key[0] == scope]:
+			del self._cache[key]
+
+	async def complete(self, ctx: discord.AutocompleteContext) -> Choices:
+		"""The autocomplete callback, pass this to `option(autocomplete=...)`"""
+		started = time.monotonic()
+		scope = ctx.interaction.user.id if self.per_user else None
+		query = "" if self.exhaustive else ctx.value.strip().lower()
+		user_id = ctx.interaction.user.id
+		current = asyncio.current_task()
+		if not self.exhaustive:
+			if previous := self._latest.get(user_id):
+				previous.cancel()
+			self._latest[user_id] = current
+		try:
+			choices = await self._lookup(ctx, scope, query, started)
+		except asyncio.CancelledError:
+			# A newer keystroke of the same user came in, this one is stale
+			self.stats["cancelled"] += 1
+			return []
+		finally:
+			if self._latest.get(user_id) is current:
+				del self._latest[user_id]
+		if self.exhaustive:
+			choices = self.matcher(choices, ctx.value.strip())
+
+		if sum(self.stats.values()) % 100 == 0:
+			logger.debug(
+				"Autocomplete %s: %.0f%% hit rate (%s)",
+				self.name,
+				self.hit_rate * 100,
+				dict(self.stats),
+			)
+		return choices[:MAX_CHOICES]
+
+	async def _lookup(
+		self,
+		ctx: discord.AutocompleteContext,
+		scope: int | None,
+		query: str,
+		started: float,
+	) -> Choices:
+		if (choices := self._get(scope, query)) is not None:
+			self.stats["hit"] += 1
+			return choices
+		if len(query) < self.min_length:
+			self.stats["partial"] += 1
+			return self._partial(scope, query)
+
+		if not self.exhaustive:
+			# Debounce, a newer keystroke cancels us while we wait
+			await asyncio.sleep(self.debounce)
+
+		key = (scope, query)
+		if key not in self._inflight:
+			self._inflight[key] = asyncio.create_task(self._fetch(ctx, key))
+		remaining = LATENCY_BUDGET - (time.monotonic() - started)
+		try:
+			# Shielded so the fetch still fills the cache if we run out of time
+			choices = await asyncio.wait_for(
+				asyncio.shield(self._inflight[key]), max(remaining, 0)
+			)
+		except TimeoutError:
+			self.stats["partial"] += 1
+			return self._partial(scope, query)
+		self.stats["miss"] += 1
+		return choices
+
+	async def _fetch(
+		self, ctx: discord.AutocompleteContext, key: tuple[int | None, str]
+	) -> Choices:
+		try:
+			choices = await self.fetch(ctx)
+			self._cache[key] = (time.monotonic(), choices)
+			self._cache.move_to_end(key)
+			while len(self._cache) > self.capacity:
+				self._cache.popitem(last=False)
+			return choices
+		finally:
+			del self._inflight[key]
+
+	def _get(self, scope: int | None, query: str) -> Choices | None:
+		if not (entry := self._cache.get((scope, query))):
+			return None
+		fetched_at, choices = entry
+		if time.monotonic() - fetched_at > self.ttl:
+			del self._cache[scope, query]
+			return None
+		self._cache.move_to_end((scope, query))
+		return choices
+
+	def _partial(self, scope: int | None, query: str) -> Choices:
+		"""Filter the cached choices of the longest cached prefix of the query"""
+		for length in range(len(query) - 1, -1, -1):
+			if (choices := self._get(scope, query[:length])) is not None:
+				return self.matcher(choices, query)
+		return []
@@ -0,0 +1,131 @@
+import os
+from datetime import date
+
+import aiohttp
+from pocketbase.models.dtos import Record
+
+from generic import logger
+from pb import PB
+
+CALENDAR_BASE_URL = "https://www.googleapis.com/calendar/v3/calendars"
+CALENDAR_HOLIDAY = r"nl.dutch%23holiday@group.v.calendar.google.com"
+
+
+class HolidayStore:
+	"""
+	Upcoming holidays, keyed by date and backed by the holidays collection
+
+	The Calendar API is synced incrementally with sync tokens, so after
+	the first (full) sync only changed events are transferred. Every
+	change is written through to PocketBase, which means holidays are
+	still known if Google is unreachable when Bert starts.
+	"""
+
+	def __init__(self):
+		self._by_date: dict[date, list[Record]] = {}
+		self._by_event: dict[str, Record] = {}
+		self._sync_token: str | None = None
+		self._loaded = False
+
+	def __len__(self) -> int:
+		return len(self._by_event)
+
+	def on(self, day: date) -> list[Record]:
+		"""Get the holidays on a given day"""
+		return self._by_date.get(day, [])
+
+	def prune(self, before: date):
+		"""Forget the holidays before a given day (they're only kept in memory)"""
+		for day in [day for day in self._by_date if day < before]:
+			for row in self._by_date.pop(day):
+				self._by_event.pop(row["event_id"], None)
+
+	async def load(self):
+		"""Load the upcoming holidays from PocketBase"""
+		today = date.today().isoformat()
+		rows = await PB.collection("holidays").get_full_list(
+			{"filter": f"date>='{today}'"}
+		)
+		for row in rows:
+			self._index(row)
+		self._loaded = True
+
+	async def refresh(self):
+		"""Sync the holidays with the Calendar API"""
+		if not self._loaded:
+			await self.load()
+		params = {"key": os.getenv("GOOGLE_API_KEY") or ""}
+		if self._sync_token:
+			params["syncToken"] = self._sync_token
+
+		changed = 0
+		async with aiohttp.ClientSession() as session:
+			while True:
+				async with session.get(
+					f"{CALENDAR_BASE_URL}/{CALENDAR_HOLIDAY}/events", params=params
+				) as res:
+					if res.status == 410 and "syncToken" in params:
+						# The sync token expired, start over with a full sync
+						logger.debug("Holiday sync token expired, doing a full sync")
+						self._sync_token = None
+						params.pop("syncToken", None)
+						params.pop("pageToken", None)
+						continue
+					res.raise_for_status()
+					data = await res.json()
+
+				for event in data["items"]:
+					changed += await self._apply(event)
+
+				if page_token := data.get("nextPageToken"):
+					params["pageToken"] = page_token
+				else:
+					self._sync_token = data.get("nextSyncToken")
+					break
+		logger.info("Synced holidays (%s changed, %s upcoming)", changed, len(self))
+
+	async def _apply(self, event: dict) -> int:
+		"""Apply a single event from the Calendar API, returns 1 if anything changed"""
+		row = self._by_event.get(event["id"])
+		if event.get("status") == "cancelled":
+			if not row:
+				return 0
+			await PB.collection("holidays").delete(row["id"])
+			self._unindex(row)
+			return 1
+
+		day = event["start"]["date"]
+		if date.fromisoformat(day) < date.today():
+			return 0
+		data = {
+			"event_id": event["id"],
+			"summary": event["summary"],
+			"description": event.get("description", "").split("\n")[0],
+			"url": event["htmlLink"],
+			"date": day,
+		}
+		if row and all(row.get(key) == value for key, value in data.items()):
+			return 0
+		if row:
+			new_row = await PB.collection("holidays").update(row["id"], data)
+			self._unindex(row)
+		else:
+			new_row = await PB.collection("holidays").create(data)
+		self._index(new_row)
+		return 1
+
+	def _index(self, row: Record):
+		self._by_event[row["event_id"]] = row
+		day = date.fromisoformat(row["date"])
+		self._by_date.setdefault(day, []).append(row)
+
+	def _unindex(self, row: Record):
+		self._by_event.pop(row["event_id"], None)
+		day = date.fromisoformat(row["date"])
+		if rows := self._by_date.get(day):
+			rows[:] = [r for r in rows if r["event_id"] != row["event_id"]]
+			if not rows:
+				del self._by_date[day]
+
+
+HOLIDAYS = HolidayStore()
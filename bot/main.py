@@ -5,26 +5,39 @@ import contextlib
 import os
 import string
 import sys
-from asyncio import sleep
-from datetime import UTC, datetime, time, timedelta
+from collections.abc import AsyncIterator, Coroutine
+from datetime import datetime, time
 from random import choice, randint
+from time import perf_counter
+from typing import Any, TypeVar
 from zoneinfo import ZoneInfo
 
+import aiohttp
 import discord
-import feedparser
-import requests
+import httpx
 import wavelink
 from art import text2art
 from discord.commands import option
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 from pocketbase import PocketBaseError
-from requests.exceptions import RequestException
 
+from autocomplete import Autocompleter, fuzzy_filter_choices
 from generic import logger
+from holidays import HOLIDAYS
+from news import NEWS, NEWS_CHANNELS
+from nodes import LAVALINK_URLS, NODES
 from pb import PB, pb_login
+from players import PLAYERS
+from playlists import PLAYLISTS, chunked, snapshot
+from prefetch import PREFETCH
+from queues import QUEUES
+from search import SEARCH
+from sounds import SOUNDS
+from tempvc import GAMES, RENAMES, PresenceCoalescer, get_playing_games
 from ui.message import StoreMessage
 from ui.musik import AddBack, RestoreQueue, StopPlayer
+from vcmaker import VCMAKER
 
 load_dotenv()
 
@@ -36,101 +49,76 @@ bert = commands.Bot(
 
 TZ = ZoneInfo(os.getenv("TZ") or "Europe/Amsterdam")
 
+T = TypeVar("T")
+# Keep references to fire-and-forget tasks so they don't get garbage collected
+background_tasks: set[asyncio.Task] = set()
+
+
+async def probe_ollama(ollama_url: str) -> str | None:
+	"""Returns the version of the Ollama server, if it's running"""
+	async with (
+		aiohttp.ClientSession() as session,
+		session.get(ollama_url + "/api/version") as res,
+	):
+		return (await res.json()).get("version")
 
-events = []
-CALENDAR_BASE_URL = "https://www.googleapis.com/calendar/v3/calendars"
-CALENDAR_HOLIDAY = r"nl.dutch%23holiday@group.v.calendar.google.com"
-try:
-	res = requests.get(
-		f"{CALENDAR_BASE_URL}/{CALENDAR_HOLIDAY}/events?key={os.getenv('GOOGLE_API_KEY')}",
-		timeout=10,
-	)
-	res.raise_for_status()
-	events = res.json()["items"]
-except RequestException as error:
-	logger.error("Failed to fetch holidays: %s", error)
-holidays = []
-for event in events:
-	start_date = datetime.strptime(event["start"]["date"], r"%Y-%m-%d").date()
-	if start_date >= datetime.now().date():
-		holidays.append(
-			{
-				"url": event["htmlLink"],
-				"summary": event["summary"],
-				"description": event["description"].split("\n")[0],
-				"start": event["start"]["date"],
-			}
-		)
-logger.info("Found %s upcoming holidays", len(holidays))
+
+async def timed(name: str, coro: Coroutine[Any, Any, T], timeout: float) -> T:
+	"""Run a startup step with a timeout, logging how long it took"""
+	started = perf_counter()
+	try:
+		return await asyncio.wait_for(coro, timeout)
+	finally:
+		logger.debug("Startup: %s took %.2fs", name, perf_counter() - started)
 
 
 async def connect_nodes():
 	"""Connect to our Lavalink nodes."""
 	await bert.wait_until_ready()
+	logger.info("Connecting to Lavalink nodes")
+	started = perf_counter()
 
 	nodes = [
-		wavelink.Node(
-			uri=os.getenv("LAVALINK_URL") or "http://lavalink:2333",
-			password=os.getenv("LAVALINK_PASSWORD"),
-		)
+		wavelink.Node(identifier=url, uri=url, password=os.getenv("LAVALINK_PASSWORD"))
+		for url in LAVALINK_URLS
 	]
 	await wavelink.Pool.connect(nodes=nodes, client=bert)
+	logger.debug("Startup: Lavalink connect took %.2fs", perf_counter() - started)
 
 
-@tasks.loop(hours=1)
+@tasks.loop(minutes=15)
 async def send_news_rss():
-	past_hour = datetime.now(TZ) - timedelta(hours=1)
-
-	overheid_data = feedparser.parse("https://feeds.rijksoverheid.nl/nieuws.rss")
-	data = overheid_data["entries"]
-	news_items_as_embeds = []
-	for entry in data:
-		published = datetime(*entry["published_parsed"][:6], tzinfo=UTC)
-		if published >= past_hour:
-			title = entry["title"]
-			description = entry["summary"]
-			url = entry["link"]
-
-			logger.debug("Found new news item: %s", title)
-			news_items_as_embeds.append(
-				discord.Embed(
-					title=title,
-					description=description,
-					url=url,
-					timestamp=published,
-				)
-			)
+	news_items_as_embeds = await NEWS.fetch_new()
 	if news_items_as_embeds:
-		news_items_as_embeds.sort(key=lambda embed: embed.timestamp)
-		channels = [
-			channel
-			for channel in bert.get_all_channels()
-			if isinstance(channel, discord.TextChannel)
-			and channel.topic
-			and "bert-news" in channel.topic.lower()
-		]
-		for channel in channels:
-			await channel.send(embeds=news_items_as_embeds)
-			await sleep(0.1)
+		await NEWS_CHANNELS.broadcast(news_items_as_embeds)
+
+
+@tasks.loop(hours=12)
+async def refresh_holidays():
+	try:
+		await timed("holiday sync", HOLIDAYS.refresh(), 30)
+	except (
+		aiohttp.ClientError,
+		TimeoutError,
+		PocketBaseError,
+		httpx.HTTPError,
+	) as error:
+		logger.error("Failed to sync holidays: %s", error)
 
 
 @tasks.loop(time=time(hour=12, minute=00, tzinfo=TZ))
 async def send_holiday():
 	today = datetime.now().date()
-	for holiday in holidays.copy():
-		holidate = datetime.strptime(holiday["start"], r"%Y-%m-%d").date()
-		if holidate > today:
-			break
-		if holidate == today:
-			embed = discord.Embed(
-				title=holiday["summary"],
-				description=holiday["description"],
-				url=holiday["url"],
-			)
-			for guild in bert.guilds:
-				if guild.system_channel:
-					await guild.system_channel.send(embed=embed)
-			holidays.remove(holiday)
+	for holiday in HOLIDAYS.on(today):
+		embed = discord.Embed(
+			title=holiday["summary"],
+			description=holiday["description"],
+			url=holiday["url"],
+		)
+		for guild in bert.guilds:
+			if guild.system_channel:
+				await guild.system_channel.send(embed=embed)
+	HOLIDAYS.prune(before=today)
 
 
 @tasks.loop(time=time(hour=00, minute=00, second=00, tzinfo=TZ))
@@ -143,22 +131,62 @@ async def happy_new_year():
 		print(text)
 
 
+@tasks.loop(minutes=30)
+async def reload_vcmaker():
+	# Safety net in case a realtime event got lost
+	try:
+		await VCMAKER.load()
+	except (PocketBaseError, httpx.HTTPError) as error:
+		logger.warning("Failed to reload the vcmaker table: %s", error)
+
+
+@tasks.loop(seconds=10)
+async def checkpoint_queues():
+	if not any(
+		node.status == wavelink.NodeStatus.CONNECTED
+		for node in wavelink.Pool.nodes.values()
+	):
+		# The players can't be trusted while Lavalink is away, keep the checkpoints
+		return
+	await QUEUES.checkpoint(
+		[vc for vc in bert.voice_clients if isinstance(vc, wavelink.Player)]
+	)
+
+
+# Lavalink sends the stats of a node every minute
+@tasks.loop(seconds=60)
+async def balance_nodes():
+	if move := NODES.overloaded():
+		await PLAYERS.migrate(*move)
+
+
+@tasks.loop(seconds=30)
+async def refresh_sounds():
+	await SOUNDS.refresh()
+
+
+@tasks.loop(hours=6)
 async def clean_db():
-	channels = await PB.collection("vcmaker").get_full_list()
-	deleted = 0
-	for channel in channels:
-		if not bert.get_channel(int(channel["channel"])):
-			await PB.collection("vcmaker").delete(channel["id"])
-			deleted += 1
-	logger.info("Cleaned database (%s rows affected)", deleted)
+	"""Delete the vcmaker rows of channels that don't exist anymore"""
+	started = perf_counter()
+	rows = VCMAKER.rows()
+	stale = [
+		int(row["channel"]) for row in rows if not bert.get_channel(int(row["channel"]))
+	]
+	deleted = await VCMAKER.delete_many(stale)
+	logger.info(
+		"Cleaned database (%s rows scanned, %s rows deleted in %.2fs)",
+		len(rows),
+		deleted,
+		perf_counter() - started,
+	)
 
 
 @bert.event
 async def on_ready():
 	logger.info("%s is ready to hurt your brain", bert.user.name)
 
-	logger.info("Connecting to Lavalink nodes")
-	await connect_nodes()
+	NEWS_CHANNELS.rebuild(bert.get_all_channels())
 
 	if not send_news_rss.is_running():
 		logger.info("Starting RSS feed task")
@@ -172,7 +200,21 @@ async def on_ready():
 		logger.info("Starting New Year task")
 		happy_new_year.start()
 
-	await clean_db()
+	if not reload_vcmaker.is_running():
+		logger.info("Starting vcmaker reload task")
+		reload_vcmaker.start()
+
+	GAMES.rebuild(
+		[
+			vc
+			for guild in bert.guilds
+			for vc in guild.voice_channels + guild.stage_channels
+		]
+	)
+
+	if not clean_db.is_running():
+		logger.info("Starting database cleanup task")
+		clean_db.start()
 
 
 @bert.event
@@ -245,44 +287,48 @@ async def on_member_remove(member: discord.Member):
 
 @bert.event
 async def on_guild_join(guild: discord.Guild):
+	for channel in guild.channels:
+		NEWS_CHANNELS.update(channel)
 	await guild.system_channel.send("bonjour me bert")
 
 
-def get_most_playing_game(vc: discord.VoiceChannel):
-	"""returns the game that is played the most in a voice channel"""
-	games = [
-		activity.name
-		for member in vc.members
-		for activity in member.activities
-		if activity.type == discord.ActivityType.playing
-	]
-	return max(set(games), key=games.count) if games else None
+@bert.event
+async def on_guild_remove(guild: discord.Guild):
+	NEWS_CHANNELS.remove_guild(guild.id)
+
+
+@bert.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+	NEWS_CHANNELS.update(channel)
+
+
+@bert.event
+async def on_guild_channel_update(
+	before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+):
+	NEWS_CHANNELS.update(after)
+
+
+@bert.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+	NEWS_CHANNELS.remove(channel.id)
 
 
 async def determine_temp_vc_name(vc: discord.VoiceChannel) -> str:
-	game = get_most_playing_game(vc)
+	game = GAMES.most_played(vc.id)
 	if game and len([member for member in vc.members if not member.bot]) > 1:
 		return game
-	result = await PB.collection("vcmaker").get_first(
-		{"filter": f"channel='{str(vc.id)}'"}
-	)
-	owner = await bert.get_or_fetch_user(int(result["owner"]))
+	row = VCMAKER.get(vc.id, "TEMPORARY")
+	owner = await bert.get_or_fetch_user(int(row["owner"]))
 	return f"{owner.display_name}'s VC"
 
 
-async def edit_vc_name(vc: discord.VoiceChannel, name: str) -> bool:
-	"""
-	Edit the name of a voice channel if it's different from the desired name
+async def update_temp_vc_name(vc: discord.VoiceChannel):
+	if VCMAKER.get(vc.id, "TEMPORARY"):
+		RENAMES.schedule(vc, await determine_temp_vc_name(vc))
 
-	This is necessary because Discord has a ratelimit
-	on editing channel names of 2 requests per 10 minutes
 
-	Returns True if the name was changed, False if it wasn't
-	"""
-	if vc.name != name:
-		await vc.edit(name=name)
-		return True
-	return False
+presence_updates = PresenceCoalescer(update_temp_vc_name)
 
 
 @bert.event
@@ -300,6 +346,8 @@ async def on_voice_state_update(
 		return
 
 	if before.channel != after.channel:  # User moved channels
+		GAMES.update(member)
+
 		if before.channel:
 			if not [
 				member for member in before.channel.members if not member.bot
@@ -307,59 +355,45 @@ async def on_voice_state_update(
 				if player := member.guild.voice_client:
 					await player.disconnect()
 
-				with contextlib.suppress(PocketBaseError):
-					row = await PB.collection("vcmaker").get_first(
-						{
-							"filter": f"channel='{str(before.channel.id)}' && type='TEMPORARY'"
-						}
-					)
-
+				if VCMAKER.get(before.channel.id, "TEMPORARY"):
 					with contextlib.suppress(
 						discord.errors.HTTPException
 					):  # This event might have triggered again
 						await before.channel.delete()
-					await PB.collection("vcmaker").delete(row["id"])
+					RENAMES.forget(before.channel.id)
+					with contextlib.suppress(PocketBaseError):
+						await VCMAKER.delete(before.channel.id)
 			else:
-				with contextlib.suppress(PocketBaseError):
-					await PB.collection("vcmaker").get_first(
-						{
-							"filter": f"channel='{str(before.channel.id)}' && type='TEMPORARY'"
-						}
-					)
-					vc_name = await determine_temp_vc_name(before.channel)
-					await edit_vc_name(before.channel, vc_name)
-
-		if after.channel:
-			with contextlib.suppress(PocketBaseError):
-				result = await PB.collection("vcmaker").get_first(
-					{"filter": f"channel='{str(after.channel.id)}'"}
+				await update_temp_vc_name(before.channel)
+
+		if after.channel and (row := VCMAKER.get(after.channel.id)):
+			if row["type"] == "PERMANENT":
+				vc = await after.channel.guild.create_voice_channel(
+					f"{member.display_name}'s VC",
+					category=after.channel.category,
 				)
-				if result["type"] == "PERMANENT":
-					vc = await after.channel.guild.create_voice_channel(
-						f"{member.display_name}'s VC",
-						category=after.channel.category,
-					)
-					await member.move_to(vc)
-					await PB.collection("vcmaker").create(
-						{
-							"channel": str(vc.id),
-							"type": "TEMPORARY",
-							"owner": str(member.id),
-						}
-					)
-				elif result["type"] == "TEMPORARY":
-					vc_name = await determine_temp_vc_name(after.channel)
-					await edit_vc_name(after.channel, vc_name)
+				await member.move_to(vc)
+				with contextlib.suppress(PocketBaseError):
+					await VCMAKER.create(vc.id, "TEMPORARY", owner=member.id)
+			elif row["type"] == "TEMPORARY":
+				await update_temp_vc_name(after.channel)
 
 
 @bert.event
 async def on_presence_update(before: discord.Member, after: discord.Member):
-	if before.activity == after.activity:
+	GAMES.update(after)
+
+	# Filter out everything that can't change a VC name before doing any I/O
+	if (
+		not after.voice
+		or not after.voice.channel
+		or not VCMAKER.get(after.voice.channel.id, "TEMPORARY")
+		or get_playing_games(before) == get_playing_games(after)
+	):
+		presence_updates.drop()
 		return
 
-	if after.voice:
-		vc_name = await determine_temp_vc_name(after.voice.channel)
-		await edit_vc_name(after.voice.channel, vc_name)
+	presence_updates.submit(after.voice.channel)
 
 
 @bert.event
@@ -368,23 +402,74 @@ async def on_wavelink_track_end(payload: wavelink.TrackEndEventPayload):
 		return
 
 	if not payload.player.queue:
-		try:
-			sounds = os.listdir("sounds")
-		except FileNotFoundError:
-			sounds = []
-		if payload.track.source != "local" and sounds:
-			bye_sound = await wavelink.Playable.search(
-				f"sounds/{choice(sounds)}", source=None
-			)
-			await payload.player.play(bye_sound[0])
+		bye_sound = SOUNDS.random()
+		if payload.track.source != "local" and bye_sound:
+			await payload.player.play(bye_sound)
 		else:
 			await payload.player.disconnect()
 
 
+@bert.event
+async def on_wavelink_track_start(payload: wavelink.TrackStartEventPayload):
+	if payload.player:
+		PREFETCH.schedule(payload.player)
+
+
+@bert.event
+async def on_wavelink_track_exception(payload: wavelink.TrackExceptionEventPayload):
+	# Autoplay moves on to the next track by itself
+	logger.warning(
+		"Track %s failed to play: %s",
+		payload.track.uri,
+		payload.exception.get("message"),
+	)
+
+
+@bert.event
+async def on_wavelink_track_stuck(payload: wavelink.TrackStuckEventPayload):
+	if payload.player:
+		logger.warning("Track %s got stuck, skipping it", payload.track.uri)
+		await payload.player.skip(force=True)
+
+
 @bert.event
 async def on_wavelink_node_ready(payload: wavelink.NodeReadyEventPayload):
 	logger.info("Lavalink node %s is ready", payload.node.identifier)
 
+	if not checkpoint_queues.is_running():
+		logger.info("Starting queue checkpoint task")
+		checkpoint_queues.start()
+
+	if not balance_nodes.is_running():
+		logger.info("Starting node balancing task")
+		balance_nodes.start()
+
+	if not refresh_sounds.is_running():
+		logger.info("Starting sounds refresh task")
+		refresh_sounds.start()
+
+	if not payload.resumed:
+		try:
+			await QUEUES.restore(bert, payload.node)
+		except (PocketBaseError, httpx.HTTPError) as error:
+			logger.warning("Failed to restore the queues: %s", error)
+
+
+@bert.event
+async def on_wavelink_stats_update(payload: wavelink.StatsEventPayload):
+	NODES.update(payload)
+
+
+@bert.event
+async def on_wavelink_node_closed(
+	node: wavelink.Node, disconnected: list[wavelink.Player]
+):
+	logger.warning(
+		"Lavalink node %s closed, moving %s players", node.identifier, len(disconnected)
+	)
+	for player in disconnected:
+		await PLAYERS.migrate(player)
+
 
 message_group = bert.create_group(
 	"message",
@@ -531,31 +616,19 @@ async def nevergonnagiveyouup(interaction: discord.Interaction, volume: int = 10
 	)
 	track = tracks[0]
 
-	player: wavelink.Player | None = interaction.guild.voice_client
-
-	if not player:
-		try:
-			player = await interaction.user.voice.channel.connect(cls=wavelink.Player)
-		except AttributeError:
-			await interaction.response.send_message(
-				"Please join a voice channel first before using this command.",
-				ephemeral=True,
-			)
-			return
-		except discord.ClientException:
-			await interaction.response.send_message(
-				"I was unable to join this voice channel. Please try again."
-			)
-			return
-
-	player.autoplay = wavelink.AutoPlayMode.partial
+	try:
+		player = await PLAYERS.acquire(interaction.user.voice.channel)
+	except discord.ClientException:
+		await interaction.response.send_message(
+			"I was unable to join this voice channel. Please try again."
+		)
+		return
 
 	await interaction.response.send_message(
 		"Rickrolling...", view=StopPlayer(ephemeral=True), ephemeral=True
 	)
 
-	if not player.playing:
-		await player.play(track, volume=volume)
+	await PLAYERS.start(player, track, volume=volume)
 
 
 @bert.slash_command(name="bert")
@@ -886,14 +959,14 @@ async def makevcmaker(
 	vc = await interaction.guild.create_voice_channel(
 		"Join to create VC", category=category
 	)
-	await PB.collection("vcmaker").create({"channel": str(vc.id), "type": "PERMANENT"})
+	await VCMAKER.create(vc.id, "PERMANENT")
 	await interaction.response.send_message(f"Created {vc.mention}")
 
 
-async def get_videos(ctx: discord.AutocompleteContext):
+async def search_videos(ctx: discord.AutocompleteContext):
 	"""search for videos"""
 	try:
-		tracks = await wavelink.Playable.search(ctx.value)
+		tracks = await SEARCH.search(ctx.value)
 	except wavelink.exceptions.LavalinkLoadException:
 		return []
 	return [
@@ -902,8 +975,54 @@ async def get_videos(ctx: discord.AutocompleteContext):
 	]
 
 
+get_videos = Autocompleter("videos", search_videos, min_length=2)
+
+
+async def enqueue_progressively(
+	player: wavelink.Player,
+	chunks: AsyncIterator[list[wavelink.Playable]],
+	name: str,
+	started: float,
+) -> bool:
+	"""
+	Queue the first chunk of tracks and start playing it, the other chunks
+	are queued in the background. Returns False if there are no tracks.
+	"""
+	first = await anext(chunks, None)
+	if not first:
+		return False
+	await player.queue.put_wait(first)
+	if await PLAYERS.start(player):
+		logger.info("Time to first audio for %s: %.2fs", name, perf_counter() - started)
+	PREFETCH.schedule(player)
+
+	async def enqueue_rest():
+		added = len(first)
+		try:
+			async for chunk in chunks:
+				if not player.connected:
+					break
+				added += await player.queue.put_wait(chunk)
+				PREFETCH.schedule(player)
+		except (
+			wavelink.WavelinkException,
+			aiohttp.ClientError,
+			PocketBaseError,
+			httpx.HTTPError,
+		) as error:
+			logger.warning("Failed to load the rest of %s: %s", name, error)
+		logger.debug(
+			"Queued %s tracks of %s in %.2fs", added, name, perf_counter() - started
+		)
+
+	task = asyncio.create_task(enqueue_rest())
+	background_tasks.add(task)
+	task.add_done_callback(background_tasks.discard)
+	return True
+
+
 @bert.slash_command()
-@option("query", description="what to search for", autocomplete=get_videos)
+@option("query", description="what to search for", autocomplete=get_videos.complete)
 @option("channel", description="the voice channel to join (default: yours)")
 async def play(
 	interaction: discord.ApplicationContext,
@@ -911,6 +1030,7 @@ async def play(
 	channel: discord.VoiceChannel = None,
 ):
 	"""Play a song or playlist"""
+	started = perf_counter()
 	if not interaction.user.voice and not channel:
 		await interaction.response.send_message(
 			"You are not in a voice channel", ephemeral=True
@@ -923,47 +1043,32 @@ async def play(
 		)
 		return
 
-	tracks = await wavelink.Playable.search(query)
+	# Searching and joining can take longer than Discord waits for a response
+	await interaction.response.defer()
+	tracks = await SEARCH.search(query)
 	if not tracks:
-		await interaction.response.send_message("No tracks found", ephemeral=True)
+		await interaction.followup.send("No tracks found", ephemeral=True)
 		return
 
-	player: wavelink.Player | None = interaction.guild.voice_client
-
-	if not player:
-		try:
-			if channel:
-				player = await channel.connect(cls=wavelink.Player)
-			else:
-				player = await interaction.user.voice.channel.connect(
-					cls=wavelink.Player
-				)
-		except AttributeError:
-			await interaction.response.send_message(
-				"Please join a voice channel first before using this command.",
-				ephemeral=True,
-			)
-			return
-		except discord.ClientException:
-			await interaction.response.send_message(
-				"I was unable to join this voice channel. Please try again."
-			)
-			return
-
-	player.autoplay = wavelink.AutoPlayMode.partial
+	try:
+		player = await PLAYERS.acquire(channel or interaction.user.voice.channel)
+	except discord.ClientException:
+		await interaction.followup.send(
+			"I was unable to join this voice channel. Please try again."
+		)
+		return
 
 	if isinstance(tracks, wavelink.Playlist):
-		added = await player.queue.put_wait(tracks)
-		await interaction.response.send_message(
-			f"Added the playlist **`{tracks.name}`** ({added} songs) to the queue"
+		await enqueue_progressively(
+			player, chunked(tracks.tracks), tracks.name, started
+		)
+		await interaction.followup.send(
+			f"Added the playlist **`{tracks.name}`** ({len(tracks)} songs) to the queue"
 		)
 	else:
 		track = tracks[0]
-		await player.queue.put_wait(track)
-		await interaction.response.send_message(f"Added `{track.title}` to the queue")
-
-	if not player.playing:
-		await player.play(player.queue.get(), volume=30)
+		await enqueue_progressively(player, chunked([track]), track.title, started)
+		await interaction.followup.send(f"Added `{track.title}` to the queue")
 
 
 pl = bert.create_group("pl", "playlists")
@@ -979,20 +1084,19 @@ async def save_playlist(interaction: discord.Interaction, url: str, name: str =
 		await interaction.response.send_message("That's not a playlist", ephemeral=True)
 		return
 	name = name or result.name
-	await PB.collection("playlists").create(
-		{"name": name, "url": url, "user_id": str(interaction.user.id)}
+	await PLAYLISTS.create(
+		interaction.user.id, {"name": name, "url": url, "tracks": snapshot(result)}
 	)
+	load_playlists.invalidate(interaction.user.id)
 	await interaction.response.send_message(
 		f"Saved the playlist as **`{name}`**. Use `/pl load` to load it"
 	)
 
 
-async def load_playlists(ctx: discord.AutocompleteContext):
+async def fetch_playlists(ctx: discord.AutocompleteContext):
 	"""load the users playlists"""
 	try:
-		playlists = await PB.collection("playlists").get_full_list(
-			{"filter": f"user_id='{ctx.interaction.user.id}'"}
-		)
+		playlists = await PLAYLISTS.all(ctx.interaction.user.id)
 		return [
 			discord.OptionChoice(playlist["name"], playlist["id"])
 			for playlist in playlists
@@ -1001,58 +1105,64 @@ async def load_playlists(ctx: discord.AutocompleteContext):
 		return []
 
 
+load_playlists = Autocompleter(
+	"playlists",
+	fetch_playlists,
+	exhaustive=True,
+	per_user=True,
+	matcher=fuzzy_filter_choices,
+	ttl=60,
+)
+
+
 @pl.command(name="load", description="Load a playlist")
-@option("name", description="The name of the playlist", autocomplete=load_playlists)
+@option(
+	"name", description="The name of the playlist", autocomplete=load_playlists.complete
+)
 async def load_playlist(interaction: discord.Interaction, name: str):
 	"""Load a playlist"""
+	started = perf_counter()
 	if not interaction.user.voice:
 		await interaction.response.send_message(
 			"You are not in a voice channel", ephemeral=True
 		)
 		return
 
-	player: wavelink.Player | None = interaction.guild.voice_client
-
-	if not player:
-		try:
-			player = await interaction.user.voice.channel.connect(cls=wavelink.Player)
-		except AttributeError:
-			await interaction.response.send_message(
-				"Please join a voice channel first before using this command.",
-				ephemeral=True,
-			)
-			return
-		except discord.ClientException:
-			await interaction.response.send_message(
-				"I was unable to join this voice channel. Please try again."
-			)
-			return
-
-	row = await PB.collection("playlists").get_first(
-		{"filter": f"id='{name}' && user_id='{str(interaction.user.id)}'"}
-	)
-	playlist = await wavelink.Playable.search(row["url"])
-
-	player.autoplay = wavelink.AutoPlayMode.partial
+	# Joining and loading the first tracks can take longer than Discord waits
+	await interaction.response.defer()
+	row = await PLAYLISTS.get(interaction.user.id, name)
+	if not row:
+		await interaction.followup.send("Playlist not found", ephemeral=True)
+		return
 
-	await player.queue.put_wait(playlist)
+	try:
+		player = await PLAYERS.acquire(interaction.user.voice.channel)
+	except discord.ClientException:
+		await interaction.followup.send(
+			"I was unable to join this voice channel. Please try again."
+		)
+		return
 
-	await interaction.response.send_message(
-		f"Loaded the playlist **`{row['name']}`** ({len(playlist)} songs)"
-	)
+	chunks = PLAYLISTS.iter_tracks(interaction.user.id, row)
+	if not await enqueue_progressively(player, chunks, row["name"], started):
+		await interaction.followup.send("That playlist is empty", ephemeral=True)
+		return
 
-	if not player.playing:
-		await player.play(player.queue.get(), volume=30)
+	await interaction.followup.send(f"Loading the playlist **`{row['name']}`**")
 
 
 @pl.command(name="delete", description="Delete a playlist")
-@option("name", description="The name of the playlist", autocomplete=load_playlists)
+@option(
+	"name", description="The name of the playlist", autocomplete=load_playlists.complete
+)
 async def delete_playlist(interaction: discord.Interaction, name: str):
 	"""Delete a playlist"""
-	row = await PB.collection("playlists").get_first(
-		{"filter": f"id='{name}' && user_id='{str(interaction.user.id)}'"}
-	)
-	await PB.collection("playlists").delete(name)
+	row = await PLAYLISTS.get(interaction.user.id, name)
+	if not row:
+		await interaction.response.send_message("Playlist not found", ephemeral=True)
+		return
+	await PLAYLISTS.delete(interaction.user.id, row["id"])
+	load_playlists.invalidate(interaction.user.id)
 	await interaction.response.send_message(f"Deleted the playlist **`{row['name']}`**")
 
 
@@ -1108,15 +1218,12 @@ async def stop(interaction: discord.Interaction):
 		await interaction.response.send_message("Not playing anything", ephemeral=True)
 		return
 
-	current_queue = wavelink.Queue()
-	await current_queue.put_wait(player.current)
-	for track in player.queue:
-		await current_queue.put_wait(track)
+	tracks = [player.current, *player.queue] if player.current else list(player.queue)
 
 	await player.stop()
 	await player.disconnect()
 	await interaction.response.send_message(
-		"Stopped playing", view=RestoreQueue(current_queue)
+		"Stopped playing", view=RestoreQueue(tracks)
 	)
 
 
@@ -1140,27 +1247,49 @@ async def volume(interaction: discord.Interaction, volume: int = 30):
 
 
 async def main():
-	try:
-		await pb_login()
-	except PocketBaseError:
-		logger.critical("Failed to login to Pocketbase")
-		sys.exit(111)  # Exit code 111: Connection refused
+	started = perf_counter()
+	ollama_url = os.getenv("OLLAMA_URL")
 
-	if ollama_url := os.getenv("OLLAMA_URL"):
+	async def start_ai():
+		if not ollama_url:
+			logger.info("No OLLAMA_URL set, AI functionality will be disabled")
+			return
 		try:
-			res = requests.get(ollama_url + "/api/version", timeout=10)
-			if ollama_version := res.json()["version"]:
-				logger.info("Ollama v%s running, enabling Bert AI", ollama_version)
-				bert.load_extension("ai")
-			else:
-				logger.warning("Ollama doesn't seem to be running on %s", ollama_url)
-				logger.info("AI functionality will be disabled")
-		except RequestException as e:
+			ollama_version = await timed("Ollama probe", probe_ollama(ollama_url), 5)
+		except (aiohttp.ClientError, TimeoutError, ValueError) as e:
 			logger.warning("Failed to connect to %s %s", ollama_url, e)
 			logger.info("AI functionality will be disabled")
-	else:
-		logger.info("No OLLAMA_URL set, AI functionality will be disabled")
+			return
+		if ollama_version:
+			logger.info("Ollama v%s running, enabling Bert AI", ollama_version)
+			bert.load_extension("ai")
+		else:
+			logger.warning("Ollama doesn't seem to be running on %s", ollama_url)
+			logger.info("AI functionality will be disabled")
+
+	async def start_pb():
+		await timed("PocketBase login", pb_login(), 10)
+		await timed("vcmaker load", VCMAKER.load(), 10)
+		await VCMAKER.subscribe()
+
+	# The AI extension has to be loaded before connecting so its commands get
+	# registered, so the Ollama probe runs alongside the (required) PocketBase login
+	pb_result, ai_result = await asyncio.gather(
+		start_pb(), start_ai(), return_exceptions=True
+	)
+	if isinstance(ai_result, BaseException):
+		logger.error("Failed to enable Bert AI: %s", ai_result)
+	if isinstance(pb_result, BaseException):
+		logger.critical("Failed to login to Pocketbase: %s", pb_result)
+		sys.exit(111)  # Exit code 111: Connection refused
+
+	# Optional subsystems don't hold up the Discord connection
+	refresh_holidays.start()
+	task = asyncio.create_task(connect_nodes())
+	background_tasks.add(task)
+	task.add_done_callback(background_tasks.discard)
 
+	logger.debug("Startup: bootstrap took %.2fs", perf_counter() - started)
 	async with bert:
 		await bert.start(os.getenv("BOT_TOKEN"))
 
@@ -0,0 +1,218 @@
+import asyncio
+import os
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+
+import aiohttp
+import discord
+import feedparser
+import httpx
+from pocketbase import PocketBaseError
+from pocketbase.models.errors import (
+	PocketBaseBadRequestError,
+	PocketBaseNotFoundError,
+)
+
+from generic import logger
+from pb import PB
+
+DEFAULT_FEEDS = "https://feeds.rijksoverheid.nl/nieuws.rss"
+NEWS_FEEDS = [
+	url.strip()
+	for url in (os.getenv("NEWS_FEEDS") or DEFAULT_FEEDS).split(",")
+	if url.strip()
+]
+# A message can hold at most 10 embeds
+EMBEDS_PER_MESSAGE = 10
+# Keep well below Discord's global ratelimit of 50 requests per second
+MAX_CONCURRENT_SENDS = 5
+# Seen items older than this are not loaded anymore, they're long gone from the feeds
+SEEN_RETENTION = timedelta(days=30)
+
+
+class NewsFeeds:
+	"""
+	Async RSS fetcher with conditional GETs and exactly-once delivery
+
+	Feeds are fetched with ETag/Last-Modified headers so unchanged feeds
+	cost a 304, and parsed in a worker thread. The GUIDs of delivered
+	items are stored in the news collection, so items are never posted
+	twice, not even across restarts.
+	"""
+
+	def __init__(self, urls: list[str]):
+		self.urls = urls
+		self._seen: dict[str, set[str]] = {url: set() for url in urls}
+		self._headers: dict[str, dict[str, str]] = {url: {} for url in urls}
+		# Feeds that have delivered items before, even if that was long ago
+		self._known: set[str] = set()
+		self._loaded = False
+
+	async def load(self):
+		"""Load the GUIDs of the items that were already delivered"""
+		since = (datetime.now(UTC) - SEEN_RETENTION).strftime(r"%Y-%m-%d %H:%M:%S")
+		rows = await PB.collection("news").get_full_list(
+			{"filter": f"created>='{since}'"}
+		)
+		for row in rows:
+			self._seen.setdefault(row["feed"], set()).add(row["guid"])
+		for url in self.urls:
+			# A feed without recent items might just have been quiet, it's only
+			# new if it never delivered anything
+			if not self._seen.get(url):
+				try:
+					await PB.collection("news").get_first({"filter": f"feed='{url}'"})
+				except PocketBaseNotFoundError:
+					continue
+			self._known.add(url)
+		self._loaded = True
+		logger.debug("Loaded %s seen news items", len(rows))
+
+	async def fetch_new(self) -> list[discord.Embed]:
+		"""Fetch all feeds and return the items that weren't delivered before"""
+		if not self._loaded:
+			try:
+				await self.load()
+			except (PocketBaseError, httpx.HTTPError) as error:
+				# Retried on the next fetch, delivering without it could cause duplicates
+				logger.warning("Failed to load the seen news items: %s", error)
+				return []
+		async with aiohttp.ClientSession() as session:
+			results = await asyncio.gather(
+				*(self._fetch_feed(session, url) for url in self.urls),
+				return_exceptions=True,
+			)
+		embeds = []
+		for url, result in zip(self.urls, results, strict=True):
+			if isinstance(result, BaseException):
+				logger.warning("Failed to fetch news feed %s: %s", url, result)
+			else:
+				embeds.extend(result)
+		embeds.sort(key=lambda embed: embed.timestamp)
+		return embeds
+
+	async def _fetch_feed(
+		self, session: aiohttp.ClientSession, url: str
+	) -> list[discord.Embed]:
+		async with session.get(url, headers=self._headers[url]) as res:
+			if res.status == 304:
+				return []
+			res.raise_for_status()
+			body = await res.read()
+			headers = {}
+			if etag := res.headers.get("ETag"):
+				headers["If-None-Match"] = etag
+			if last_modified := res.headers.get("Last-Modified"):
+				headers["If-Modified-Since"] = last_modified
+
+		feed = await asyncio.to_thread(feedparser.parse, body)
+		seen = self._seen[url]
+		first_run = url not in self._known
+		complete = True
+		embeds = []
+		for entry in feed["entries"]:
+			guid = entry.get("id") or entry["link"]
+			if guid in seen:
+				continue
+			# Mark as seen before sending, a failed send shouldn't cause duplicates
+			try:
+				await PB.collection("news").create({"feed": url, "guid": guid})
+			except PocketBaseBadRequestError:
+				# Already stored, but older than SEEN_RETENTION
+				seen.add(guid)
+				continue
+			except PocketBaseError as error:
+				logger.warning("Failed to store news item %s: %s", guid, error)
+				complete = False
+				continue
+			seen.add(guid)
+			if first_run:
+				# Don't flood the channels with the whole backlog of a new feed
+				continue
+
+			logger.debug("Found new news item: %s", entry["title"])
+			published = (
+				datetime(*entry["published_parsed"][:6], tzinfo=UTC)
+				if entry.get("published_parsed")
+				else datetime.now(UTC)
+			)
+			embeds.append(
+				discord.Embed(
+					title=entry["title"],
+					description=entry.get("summary"),
+					url=entry["link"],
+					timestamp=published,
+				)
+			)
+		if seen:
+			self._known.add(url)
+		# Only remember the validators once every item has been stored, otherwise
+		# the next fetch would get a 304 and never retry the failed items
+		if complete:
+			self._headers[url] = headers
+		return embeds
+
+
+def is_news_channel(channel: discord.abc.GuildChannel) -> bool:
+	return (
+		isinstance(channel, discord.TextChannel)
+		and bool(channel.topic)
+		and "bert-news" in channel.topic.lower()
+	)
+
+
+class NewsSubscriptions:
+	"""
+	Index of the channels that have "bert-news" in their topic
+
+	Kept up to date from the guild channel events, so finding the
+	broadcast targets doesn't need a scan over every channel.
+	"""
+
+	def __init__(self):
+		self._channels: dict[int, discord.TextChannel] = {}
+
+	def __len__(self) -> int:
+		return len(self._channels)
+
+	def rebuild(self, channels: Iterable[discord.abc.GuildChannel]):
+		self._channels = {
+			channel.id: channel for channel in channels if is_news_channel(channel)
+		}
+
+	def update(self, channel: discord.abc.GuildChannel):
+		if is_news_channel(channel):
+			self._channels[channel.id] = channel
+		else:
+			self._channels.pop(channel.id, None)
+
+	def remove(self, channel_id: int):
+		self._channels.pop(channel_id, None)
+
+	def remove_guild(self, guild_id: int):
+		for channel in list(self._channels.values()):
+			if channel.guild.id == guild_id:
+				del self._channels[channel.id]
+
+	async def broadcast(self, embeds: list[discord.Embed]):
+		"""Send the embeds to every subscribed channel concurrently"""
+		semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+
+		async def send(channel: discord.TextChannel):
+			try:
+				for i in range(0, len(embeds), EMBEDS_PER_MESSAGE):
+					async with semaphore:
+						await channel.send(embeds=embeds[i : i + EMBEDS_PER_MESSAGE])
+			except (discord.Forbidden, discord.NotFound):
+				logger.warning("Can't send news to %s, unsubscribing it", channel.id)
+				self.remove(channel.id)
+			except discord.HTTPException as error:
+				logger.warning("Failed to send news to %s: %s", channel.id, error)
+
+		await asyncio.gather(
+			*(send(channel) for channel in list(self._channels.values()))
+		)
+
+
+NEWS = NewsFeeds(NEWS_FEEDS)
+NEWS_CHANNELS = NewsSubscriptions()
@@ -0,0 +1,126 @@
+import os
+from functools import wraps
+
+import discord
+import wavelink
+from wavelink.websocket import Websocket
+
+from generic import logger
+
+LAVALINK_URLS = [
+	url.strip()
+	for url in (os.getenv("LAVALINK_URL") or "http://lavalink:2333").split(",")
+	if url.strip()
+]
+# A node is overloaded if its penalty is this much higher than the best node's
+OVERLOAD_MARGIN = 100
+
+
+def penalty(stats: wavelink.StatsEventPayload) -> float:
+	"""The load of a node, using the penalties of the Lavalink clients"""
+	cpu = 1.05 ** (100 * stats.cpu.system_load) * 10 - 10
+	frames = 0.0
+	if stats.frames:
+		deficit = 1.03 ** (500 * stats.frames.deficit / 3000) * 600 - 600
+		nulled = 1.03 ** (500 * stats.frames.nulled / 3000) * 300 - 300
+		frames = deficit + nulled * 2
+	return stats.playing + cpu + frames
+
+
+def last_position(player: wavelink.Player) -> int:
+	"""
+	The position of a player, also if it was disconnected (e.g. by a node
+	that closed), which makes wavelink report 0
+	"""
+	if player.connected or not player.current:
+		return player.position
+	# The position Lavalink reported in its last player update
+	return getattr(player, "_last_position", 0)
+
+
+class NodeBalancer:
+	"""
+	Places players on the least loaded Lavalink node
+
+	Nodes push their stats over the websocket, `update` turns them into a
+	penalty (playing players, CPU load and frame deficit) that players are
+	placed by. `overloaded` picks a player to move off an overloaded node,
+	PlayerManager.migrate moves it.
+	"""
+
+	def __init__(self):
+		self._penalties: dict[str, float] = {}
+
+	def nodes(self) -> list[wavelink.Node]:
+		return [
+			node
+			for node in wavelink.Pool.nodes.values()
+			if node.status == wavelink.NodeStatus.CONNECTED
+		]
+
+	def penalty(self, node: wavelink.Node) -> float:
+		# Nodes without stats yet are ranked by their players
+		return self._penalties.get(node.identifier, len(node.players))
+
+	def best(self, exclude: wavelink.Node | None = None) -> wavelink.Node | None:
+		nodes = [node for node in self.nodes() if node is not exclude]
+		return min(nodes, key=self.penalty, default=None)
+
+	def update(self, payload: wavelink.StatsEventPayload):
+		"""Keep the stats a node pushed"""
+		self._penalties[payload.node.identifier] = penalty(payload)
+
+	def overloaded(self) -> tuple[wavelink.Player, wavelink.Node] | None:
+		"""A player to move off an overloaded node, and the node to move it to"""
+		nodes = self.nodes()
+		if len(nodes) < 2:
+			return None
+		worst = max(nodes, key=self.penalty)
+		best = min(nodes, key=self.penalty)
+		if self.penalty(worst) - self.penalty(best) < OVERLOAD_MARGIN:
+			return None
+		players = [player for player in worst.players.values() if player.playing]
+		if not players:
+			return None
+		logger.info(
+			"Node %s is overloaded (%.0f vs %.0f)",
+			worst.identifier,
+			self.penalty(worst),
+			self.penalty(best),
+		)
+		# Count the moved player until the node sends its next stats
+		self._penalties[best.identifier] = self.penalty(best) + 1
+		return players[0], best
+
+
+NODES = NodeBalancer()
+
+
+def _with_node(dispatch):
+	"""Stats events don't say which node sent them, add it to the payload"""
+
+	@wraps(dispatch)
+	def wrapper(self: Websocket, event: str, /, *args, **kwargs):
+		if event == "stats_update":
+			args[0].node = self.node
+		dispatch(self, event, *args, **kwargs)
+
+	return wrapper
+
+
+Websocket.dispatch = _with_node(Websocket.dispatch)
+
+
+class BalancedPlayer(wavelink.Player):
+	"""A wavelink.Player that is placed on the least loaded node"""
+
+	def __init__(
+		self,
+		client: discord.Client = discord.utils.MISSING,
+		channel: discord.abc.Connectable = discord.utils.MISSING,
+		*,
+		nodes: list[wavelink.Node] | None = None,
+	):
+		if not nodes and (node := NODES.best()):
+			nodes = [node]
+		super().__init__(client, channel, nodes=nodes)
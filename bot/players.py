@@ -0,0 +1,126 @@
+import asyncio
+from contextlib import suppress
+from functools import partial
+
+import aiohttp
+import discord
+import wavelink
+
+from generic import logger
+from nodes import NODES, BalancedPlayer, last_position
+
+DEFAULT_VOLUME = 30
+# Give up on joining a voice channel after this many seconds
+CONNECT_TIMEOUT = 10
+
+
+class PlayerManager:
+	"""
+	The one place that connects players and starts playback
+
+	Every guild has a lock, so concurrent commands in the same guild share
+	one voice connection instead of racing to open their own, and only one
+	of them starts playing. A connected player is reused without waiting
+	for the lock. Players are moved between Lavalink nodes through
+	`migrate`, which reconnects under the same lock.
+	"""
+
+	def __init__(self):
+		self._locks: dict[int, asyncio.Lock] = {}
+
+	def _lock(self, guild_id: int) -> asyncio.Lock:
+		return self._locks.setdefault(guild_id, asyncio.Lock())
+
+	async def acquire(
+		self, channel: discord.abc.Connectable, node: wavelink.Node | None = None
+	) -> wavelink.Player:
+		"""
+		Get the player of the guild of a channel, connecting to the channel
+		(on `node`, or the least loaded node) if there is none. Raises
+		discord.ClientException if connecting fails.
+		"""
+		guild = channel.guild
+		if (player := guild.voice_client) and player.connected:
+			return player
+		async with self._lock(guild.id):
+			if (player := guild.voice_client) and player.connected:
+				return player
+			try:
+				player = await channel.connect(
+					cls=partial(BalancedPlayer, nodes=[node])
+					if node
+					else BalancedPlayer,
+					timeout=CONNECT_TIMEOUT,
+				)
+			except wavelink.WavelinkException as error:
+				logger.warning("Failed to connect to %s: %s", channel.id, error)
+				if guild.voice_client:
+					with suppress(wavelink.WavelinkException, aiohttp.ClientError):
+						await guild.voice_client.disconnect(force=True)
+				raise discord.ClientException(str(error)) from error
+			player.autoplay = wavelink.AutoPlayMode.partial
+			return player
+
+	async def start(
+		self,
+		player: wavelink.Player,
+		track: wavelink.Playable | None = None,
+		*,
+		volume: int = DEFAULT_VOLUME,
+	) -> bool:
+		"""
+		Play a track, or the next track in the queue, unless the player is
+		already playing. Returns whether playback was started.
+		"""
+		async with self._lock(player.guild.id):
+			if player.playing or not (track or player.queue):
+				return False
+			await player.play(track or player.queue.get(), volume=volume)
+			return True
+
+	async def migrate(
+		self, player: wavelink.Player, node: wavelink.Node | None = None
+	) -> wavelink.Player | None:
+		"""Move a player to another node, keeping its queue and position"""
+		node = node or NODES.best(exclude=player.node)
+		channel = player.channel
+		if not node or not channel:
+			return None
+		current, position = player.current, last_position(player)
+		volume, paused, autoplay = player.volume, player.paused, player.autoplay
+		queue = player.queue.copy()
+
+		if player.connected:
+			with suppress(wavelink.WavelinkException, aiohttp.ClientError):
+				await player.disconnect()
+		guild = channel.guild
+		try:
+			new_player = await self.acquire(channel, node)
+			new_player.autoplay = autoplay
+			new_player.queue = queue
+			if current:
+				await new_player.play(
+					current, start=position, volume=volume, paused=paused
+				)
+		except (
+			TimeoutError,
+			discord.ClientException,
+			wavelink.WavelinkException,
+			aiohttp.ClientError,
+		) as error:
+			logger.warning("Failed to move the player of %s: %s", guild.id, error)
+			# Don't leave a half connected player behind, it blocks new connections
+			if guild.voice_client:
+				with suppress(wavelink.WavelinkException, aiohttp.ClientError):
+					await guild.voice_client.disconnect(force=True)
+			return None
+		logger.info(
+			"Moved the player of %s from %s to %s",
+			guild.id,
+			player.node.identifier,
+			new_player.node.identifier,
+		)
+		return new_player
+
+
+PLAYERS = PlayerManager()
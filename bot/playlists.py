@@ -0,0 +1,196 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+import httpx
+import wavelink
+from pocketbase import PocketBaseError
+from pocketbase.models.dtos import Record
+
+from generic import logger
+from pb import PB
+
+# Snapshots are re-resolved against their source at most this often
+SNAPSHOT_TTL = 6 * 60 * 60
+# Tracks that are decoded or queued at once when loading a playlist
+DECODE_CHUNK_SIZE = 50
+# The index leaves out the snapshots, they're only needed to load a playlist
+INDEX_FIELDS = "id,name,url,user_id"
+
+
+def snapshot(playlist: wavelink.Playlist) -> list[str]:
+	"""Serialise the tracks of a playlist as encoded Lavalink tracks"""
+	return [track.encoded for track in playlist.tracks]
+
+
+async def decode_tracks(encoded: list[str]) -> list[wavelink.Playable]:
+	"""Turn a snapshot back into tracks with a single Lavalink request"""
+	node = wavelink.Pool.get_node()
+	payloads = await node.send("POST", path="v4/decodetracks", data=encoded)
+	return [wavelink.Playable(payload) for payload in payloads]
+
+
+async def chunked(
+	tracks: list[wavelink.Playable],
+) -> AsyncIterator[list[wavelink.Playable]]:
+	"""Split tracks into a chunk of just the first track and chunks of DECODE_CHUNK_SIZE"""
+	if tracks:
+		yield tracks[:1]
+	for i in range(1, len(tracks), DECODE_CHUNK_SIZE):
+		yield tracks[i : i + DECODE_CHUNK_SIZE]
+
+
+class PlaylistIndex:
+	"""
+	Per-user cache of the playlists collection
+
+	A user's playlists are loaded the first time they're needed and kept
+	up to date on save and delete, so autocomplete, load and delete don't
+	need a PocketBase read.
+
+	Playlists also store a snapshot of their resolved tracks, so loading
+	one is a single decode request instead of resolving the whole source
+	again. Snapshots aren't cached, they're fetched when a playlist is
+	loaded and refreshed against the source in the background.
+	"""
+
+	def __init__(self):
+		self._users: dict[int, dict[str, Record]] = {}
+		self._locks: dict[int, asyncio.Lock] = {}
+		self._refreshed: dict[str, float] = {}
+		self._refreshing: dict[str, asyncio.Task] = {}
+
+	async def all(self, user_id: int) -> list[Record]:
+		return list((await self._load(user_id)).values())
+
+	async def get(self, user_id: int, key: str) -> Record | None:
+		"""Get a playlist by id, or by name if no playlist has that id"""
+		playlists = await self._load(user_id)
+		if row := playlists.get(key):
+			return row
+		return next(
+			(row for row in playlists.values() if row["name"].lower() == key.lower()),
+			None,
+		)
+
+	async def create(self, user_id: int, data: dict) -> Record:
+		row = await PB.collection("playlists").create(
+			{**data, "user_id": str(user_id)}, {"params": {"fields": INDEX_FIELDS}}
+		)
+		if user_id in self._users:
+			self._users[user_id][row["id"]] = row
+		return row
+
+	async def update(self, user_id: int, playlist_id: str, data: dict) -> Record:
+		row = await PB.collection("playlists").update(
+			playlist_id, data, {"params": {"fields": INDEX_FIELDS}}
+		)
+		if user_id in self._users:
+			self._users[user_id][row["id"]] = row
+		return row
+
+	async def delete(self, user_id: int, playlist_id: str):
+		await PB.collection("playlists").delete(playlist_id)
+		if user_id in self._users:
+			self._users[user_id].pop(playlist_id, None)
+
+	async def iter_tracks(
+		self, user_id: int, row: Record
+	) -> AsyncIterator[list[wavelink.Playable]]:
+		"""
+		Get the tracks of a playlist in chunks, the first chunk is just the first track
+
+		Snapshots are decoded chunk by chunk, so playback can start before the
+		whole playlist is decoded. Playlists without a (valid) snapshot are
+		resolved from their source.
+		"""
+		done = 0
+		if encoded := await self._fetch_snapshot(row):
+			try:
+				while done < len(encoded):
+					size = DECODE_CHUNK_SIZE if done else 1
+					chunk = await decode_tracks(encoded[done : done + size])
+					done += size
+					yield chunk
+			except wavelink.WavelinkException as error:
+				logger.warning("Failed to decode playlist %s: %s", row["id"], error)
+			else:
+				self.refresh(user_id, row, encoded)
+				return
+
+		result = await wavelink.Playable.search(row["url"])
+		if isinstance(result, wavelink.Playlist):
+			try:
+				await self._store_snapshot(user_id, row, result, encoded)
+			except (PocketBaseError, httpx.HTTPError) as error:
+				# The tracks are there, only the next load will be slower
+				logger.warning(
+					"Failed to store the snapshot of playlist %s: %s", row["id"], error
+				)
+			tracks = result.tracks
+		else:
+			tracks = list(result)
+		# Skip the tracks that were already decoded from the snapshot
+		async for chunk in chunked(tracks[done:]):
+			yield chunk
+
+	def refresh(self, user_id: int, row: Record, encoded: list[str]):
+		"""Re-resolve the source of a playlist in the background if its snapshot is old"""
+		refreshed = self._refreshed.get(row["id"])
+		if row["id"] in self._refreshing or (
+			refreshed and time.monotonic() - refreshed < SNAPSHOT_TTL
+		):
+			return
+		task = asyncio.create_task(self._refresh(user_id, row, encoded))
+		self._refreshing[row["id"]] = task
+		task.add_done_callback(lambda _: self._refreshing.pop(row["id"], None))
+
+	def invalidate(self, user_id: int):
+		self._users.pop(user_id, None)
+
+	async def _load(self, user_id: int) -> dict[str, Record]:
+		if (playlists := self._users.get(user_id)) is not None:
+			return playlists
+		async with self._locks.setdefault(user_id, asyncio.Lock()):
+			if (playlists := self._users.get(user_id)) is None:
+				rows = await PB.collection("playlists").get_full_list(
+					{
+						"filter": f"user_id='{user_id}'",
+						"params": {"fields": INDEX_FIELDS},
+					}
+				)
+				playlists = {row["id"]: row for row in rows}
+				self._users[user_id] = playlists
+		return playlists
+
+	async def _fetch_snapshot(self, row: Record) -> list[str]:
+		try:
+			tracks = await PB.collection("playlists").get_one(
+				row["id"], {"params": {"fields": "tracks"}}
+			)
+		except (PocketBaseError, httpx.HTTPError) as error:
+			logger.warning(
+				"Failed to fetch the snapshot of playlist %s: %s", row["id"], error
+			)
+			return []
+		return tracks.get("tracks") or []
+
+	async def _refresh(self, user_id: int, row: Record, encoded: list[str]):
+		try:
+			result = await wavelink.Playable.search(row["url"])
+			if isinstance(result, wavelink.Playlist):
+				await self._store_snapshot(user_id, row, result, encoded)
+		except (wavelink.WavelinkException, PocketBaseError, httpx.HTTPError) as error:
+			logger.warning("Failed to refresh playlist %s: %s", row["id"], error)
+
+	async def _store_snapshot(
+		self, user_id: int, row: Record, playlist: wavelink.Playlist, encoded: list[str]
+	):
+		self._refreshed[row["id"]] = time.monotonic()
+		tracks = snapshot(playlist)
+		if tracks != encoded:
+			await self.update(user_id, row["id"], {"tracks": tracks})
+			logger.debug("Updated the snapshot of playlist %s", row["id"])
+
+
+PLAYLISTS = PlaylistIndex()
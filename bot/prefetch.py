@@ -0,0 +1,72 @@
+import asyncio
+
+import aiohttp
+import wavelink
+
+from generic import logger
+from search import SEARCH
+
+# How many of the upcoming tracks are validated ahead of time
+PREFETCH_DEPTH = 3
+
+
+class QueuePrefetcher:
+	"""
+	Validates the next tracks of a queue before they're played
+
+	Tracks can be restored from old playlist snapshots or queue checkpoints,
+	and videos get removed or made private in the meantime. The next
+	PREFETCH_DEPTH tracks are resolved again (through the search cache),
+	broken tracks are dropped from the queue and outdated ones are
+	replaced, so the next track always starts right away. Without this,
+	wavelink's autoplay gives up after three tracks in a row fail to load.
+	"""
+
+	def __init__(self, depth: int = PREFETCH_DEPTH):
+		self.depth = depth
+		self._tasks: dict[int, asyncio.Task] = {}
+
+	def schedule(self, player: wavelink.Player):
+		"""Validate the upcoming tracks of a player in the background"""
+		guild_id = player.guild.id
+		if (task := self._tasks.get(guild_id)) and not task.done():
+			return
+		task = asyncio.create_task(self._prefetch(player))
+		self._tasks[guild_id] = task
+		task.add_done_callback(
+			lambda done: (
+				self._tasks.pop(guild_id, None)
+				if self._tasks.get(guild_id) is done
+				else None
+			)
+		)
+
+	async def _prefetch(self, player: wavelink.Player):
+		for track in player.queue[: self.depth]:
+			if track.source == "local" or not track.uri:
+				continue
+			try:
+				result = await SEARCH.search(track.uri)
+			except wavelink.LavalinkLoadException as error:
+				logger.debug("Queued track %s failed to load: %s", track.uri, error)
+				result = []
+			except (wavelink.WavelinkException, aiohttp.ClientError) as error:
+				# Lavalink itself is having trouble, the track might be fine
+				logger.warning("Failed to prefetch %s: %s", track.uri, error)
+				return
+			if not player.connected:
+				return
+			try:
+				index = player.queue.index(track)
+			except ValueError:
+				# Played or removed in the meantime
+				continue
+			tracks = result.tracks if isinstance(result, wavelink.Playlist) else result
+			if not tracks:
+				logger.info("Removing broken track %s from the queue", track.uri)
+				del player.queue[index]
+			elif tracks[0].encoded != track.encoded:
+				player.queue[index] = tracks[0]
+
+
+PREFETCH = QueuePrefetcher()
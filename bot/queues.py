@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import aiohttp
+import discord
+import httpx
+import wavelink
+from pocketbase import PocketBaseError
+from pocketbase.models.dtos import Record
+
+from generic import logger
+from pb import PB
+from players import PLAYERS
+from playlists import decode_tracks
+
+# A changed position alone is written at most this often (in seconds)
+POSITION_INTERVAL = 60
+# Keep well below PocketBase's request limits when many guilds change at once
+MAX_CONCURRENT_WRITES = 5
+
+
+def queue_state(player: wavelink.Player) -> dict | None:
+	"""The state of a player as a queues row, None if there's nothing to keep"""
+	if not player.connected or not player.current or not player.channel:
+		return None
+	if player.current.source == "local":
+		# Goodbye sounds, the queue is done
+		return None
+	return {
+		"guild_id": str(player.guild.id),
+		"channel_id": str(player.channel.id),
+		"current": player.current.encoded,
+		"position": player.position,
+		"tracks": [track.encoded for track in player.queue],
+		"volume": player.volume,
+	}
+
+
+class QueueStore:
+	"""
+	Checkpoints of the music queues in the queues collection
+
+	`checkpoint` is called on an interval and writes the changes of all
+	players in one batch, so playing music never waits for PocketBase.
+	Only changed queues are written, a position that changed on its own is
+	written at most every POSITION_INTERVAL seconds. After a restart or a
+	Lavalink reconnect `restore` reconnects and resumes every checkpointed
+	queue where it was.
+	"""
+
+	def __init__(self):
+		self._rows: dict[int, Record] = {}
+		self._written_at: dict[int, float] = {}
+		self._restore_lock = asyncio.Lock()
+
+	def _changed(self, guild_id: int, state: dict) -> bool:
+		if not (row := self._rows.get(guild_id)):
+			return True
+		if any(
+			row.get(key) != value for key, value in state.items() if key != "position"
+		):
+			return True
+		return (
+			row.get("position") != state["position"]
+			and time.monotonic() - self._written_at.get(guild_id, 0) > POSITION_INTERVAL
+		)
+
+	async def checkpoint(self, players: list[wavelink.Player]):
+		"""Write the changed queues, and delete the queues that have stopped"""
+		if self._restore_lock.locked():
+			# Queues that are being restored don't have a player yet
+			return
+		states = {player.guild.id: queue_state(player) for player in players}
+		writes = {
+			guild_id: state
+			for guild_id, state in states.items()
+			if state and self._changed(guild_id, state)
+		}
+		deletes = [guild_id for guild_id in self._rows if not states.get(guild_id)]
+		if not writes and not deletes:
+			return
+
+		semaphore = asyncio.Semaphore(MAX_CONCURRENT_WRITES)
+
+		async def write(guild_id: int, state: dict | None):
+			async with semaphore:
+				try:
+					if state is None:
+						await PB.collection("queues").delete(self._rows[guild_id]["id"])
+						del self._rows[guild_id]
+						return
+					if row := self._rows.get(guild_id):
+						row = await PB.collection("queues").update(row["id"], state)
+					else:
+						row = await PB.collection("queues").create(state)
+					self._rows[guild_id] = row
+					self._written_at[guild_id] = time.monotonic()
+				except (PocketBaseError, httpx.HTTPError) as error:
+					logger.warning(
+						"Failed to checkpoint the queue of %s: %s", guild_id, error
+					)
+
+		await asyncio.gather(
+			*(write(guild_id, state) for guild_id, state in writes.items()),
+			*(write(guild_id, None) for guild_id in deletes),
+		)
+		logger.debug("Checkpointed %s queues, deleted %s", len(writes), len(deletes))
+
+	async def restore(self, bot: discord.Bot, node: wavelink.Node) -> int:
+		"""
+		Resume the checkpointed queues that aren't playing, returns how many
+
+		Players on `node` are resumed as well, a node that (re)connected
+		without resuming its session has lost them.
+		"""
+		async with self._restore_lock:
+			rows = await PB.collection("queues").get_full_list()
+			restored = 0
+			for row in rows:
+				guild_id = int(row["guild_id"])
+				self._rows[guild_id] = row
+				try:
+					restored += await self._restore(bot, node, row)
+				except (
+					discord.DiscordException,
+					wavelink.WavelinkException,
+					aiohttp.ClientError,
+					PocketBaseError,
+					httpx.HTTPError,
+				) as error:
+					logger.warning(
+						"Failed to restore the queue of %s: %s", guild_id, error
+					)
+			logger.info("Restored %s of %s queues", restored, len(rows))
+			return restored
+
+	async def _restore(
+		self, bot: discord.Bot, node: wavelink.Node, row: Record
+	) -> bool:
+		guild = bot.get_guild(int(row["guild_id"]))
+		channel = guild and guild.get_channel(int(row["channel_id"]))
+		player: wavelink.Player | None = guild and guild.voice_client
+		if player and player.playing and player.node is not node:
+			return False
+		if not channel or not [member for member in channel.members if not member.bot]:
+			# Nobody to play for anymore, the next checkpoint deletes the row
+			return False
+
+		tracks = await decode_tracks([row["current"], *(row.get("tracks") or [])])
+		player = await PLAYERS.acquire(channel)
+		player.queue.clear()
+		await player.queue.put_wait(tracks[1:])
+		await player.play(
+			tracks[0], start=int(row["position"]), volume=int(row["volume"])
+		)
+		return True
+
+
+QUEUES = QueueStore()
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import wavelink
+
+SearchResult = list[wavelink.Playable] | wavelink.Playlist
+
+
+def normalise_query(query: str) -> str:
+	query = query.strip()
+	if "://" in query:
+		# URLs can be case sensitive (e.g. YouTube video ids)
+		return query
+	return " ".join(query.lower().split())
+
+
+class TrackSearchCache:
+	"""
+	LRU+TTL cache in front of wavelink.Playable.search
+
+	Concurrent searches for the same (normalised) query share a single
+	Lavalink request, and every track that comes back is also cached
+	under its own URI, so submitting an autocompleted /play doesn't have
+	to search again.
+	"""
+
+	def __init__(self, capacity: int = 512, ttl: float = 600):
+		self.capacity = capacity
+		self.ttl = ttl
+		self._entries: OrderedDict[str, tuple[float, SearchResult]] = OrderedDict()
+		self._inflight: dict[str, asyncio.Task[SearchResult]] = {}
+
+	def get(self, query: str) -> SearchResult | None:
+		key = normalise_query(query)
+		if not (entry := self._entries.get(key)):
+			return None
+		stored_at, result = entry
+		if time.monotonic() - stored_at > self.ttl:
+			del self._entries[key]
+			return None
+		self._entries.move_to_end(key)
+		return result
+
+	def put(self, query: str, result: SearchResult):
+		now = time.monotonic()
+		key = normalise_query(query)
+		self._entries[key] = (now, result)
+		self._entries.move_to_end(key)
+		tracks = result.tracks if isinstance(result, wavelink.Playlist) else result
+		for track in tracks:
+			if track.uri:
+				self._entries[normalise_query(track.uri)] = (now, [track])
+		while len(self._entries) > self.capacity:
+			self._entries.popitem(last=False)
+
+	async def search(self, query: str) -> SearchResult:
+		if (result := self.get(query)) is not None:
+			return result
+		key = normalise_query(query)
+		if key not in self._inflight:
+			self._inflight[key] = asyncio.create_task(self._search(query, key))
+		# Shielded so a cancelled caller doesn't cancel the search for everyone
+		return await asyncio.shield(self._inflight[key])
+
+	async def _search(self, query: str, key: str) -> SearchResult:
+		try:
+			result = await wavelink.Playable.search(query)
+			if result:
+				self.put(query, result)
+			return result
+		finally:
+			del self._inflight[key]
+
+
+SEARCH = TrackSearchCache()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+from random import choice
+
+import wavelink
+
+from generic import logger
+
+SOUNDS_DIRECTORY = "sounds"
+
+
+class SoundIndex:
+	"""
+	The local sounds, resolved to Lavalink tracks once
+
+	`refresh` is polled and only rescans the directory when its mtime
+	changed, and only resolves files that are new or were modified. Picking
+	a sound needs neither a filesystem scan nor a Lavalink search.
+	"""
+
+	def __init__(self, directory: str = SOUNDS_DIRECTORY):
+		self.directory = directory
+		self._mtime: float | None = None
+		self._files: dict[str, float] = {}
+		self._tracks: dict[str, wavelink.Playable] = {}
+
+	def __len__(self) -> int:
+		return len(self._tracks)
+
+	def random(self) -> wavelink.Playable | None:
+		if not self._tracks:
+			return None
+		return self._tracks[choice(list(self._tracks))]
+
+	async def refresh(self):
+		"""Rescan the sounds directory if it changed"""
+		try:
+			mtime = os.stat(self.directory).st_mtime
+		except FileNotFoundError:
+			mtime = None
+		# Files that are overwritten in place don't change the mtime of the directory
+		if mtime == self._mtime and all(
+			self._file_mtime(name) == file_mtime
+			for name, file_mtime in self._files.items()
+		):
+			return
+		self._mtime = mtime
+
+		files = {}
+		if mtime is not None:
+			with os.scandir(self.directory) as entries:
+				files = {
+					entry.name: entry.stat().st_mtime
+					for entry in entries
+					if entry.is_file()
+				}
+		for name in set(self._files) - set(files):
+			self._tracks.pop(name, None)
+		changed = [
+			name
+			for name, file_mtime in files.items()
+			if self._files.get(name) != file_mtime
+		]
+		self._files = files
+
+		results = await asyncio.gather(
+			*(self._resolve(name) for name in changed), return_exceptions=True
+		)
+		for name, result in zip(changed, results, strict=True):
+			if isinstance(result, BaseException) or not result:
+				logger.warning("Failed to load sound %s: %s", name, result)
+				self._tracks.pop(name, None)
+				# Retry on the next refresh
+				self._files.pop(name, None)
+				self._mtime = None
+			else:
+				self._tracks[name] = result[0]
+		logger.debug("Loaded %s sounds (%s changed)", len(self), len(changed))
+
+	def _file_mtime(self, name: str) -> float | None:
+		try:
+			return os.stat(os.path.join(self.directory, name)).st_mtime
+		except FileNotFoundError:
+			return None
+
+	async def _resolve(self, name: str) -> wavelink.Search:
+		return await wavelink.Playable.search(f"{self.directory}/{name}", source=None)
+
+
+SOUNDS = SoundIndex()
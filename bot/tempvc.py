@@ -0,0 +1,221 @@
+import asyncio
+import time
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+
+import discord
+
+from generic import logger
+
+# Discord allows 2 channel renames per 10 minutes per channel
+RENAME_LIMIT = 2
+RENAME_WINDOW = 600
+
+
+class RenameScheduler:
+	"""
+	Debounced per-channel voice channel renamer
+
+	Renames are queued instead of awaited. Pending renames for the same
+	channel are merged so only the latest name gets applied, and the
+	rename budget of every channel is tracked so we wait for the window
+	to open ourselves instead of running into 429s.
+	"""
+
+	def __init__(self):
+		self._pending: dict[int, tuple[discord.VoiceChannel, str]] = {}
+		self._history: dict[int, deque[float]] = {}
+		self._tasks: dict[int, asyncio.Task] = {}
+
+	def schedule(self, vc: discord.VoiceChannel, name: str):
+		"""Rename a voice channel as soon as the ratelimit allows it"""
+		self._pending[vc.id] = (vc, name)
+		# A task that is done but not cleaned up yet won't see the new name
+		if (task := self._tasks.get(vc.id)) is None or task.done():
+			task = asyncio.create_task(self._run(vc.id))
+			self._tasks[vc.id] = task
+			task.add_done_callback(lambda _: self._task_done(vc.id, task))
+
+	def forget(self, channel_id: int):
+		"""Drop all state of a channel, e.g. because it got deleted"""
+		self._pending.pop(channel_id, None)
+		self._history.pop(channel_id, None)
+		if task := self._tasks.pop(channel_id, None):
+			task.cancel()
+
+	def _task_done(self, channel_id: int, task: asyncio.Task):
+		if self._tasks.get(channel_id) is task:
+			del self._tasks[channel_id]
+
+	def _wait_time(self, channel_id: int) -> float:
+		history = self._history.get(channel_id)
+		if not history or len(history) < RENAME_LIMIT:
+			return 0
+		return max(0, history[0] + RENAME_WINDOW - time.monotonic())
+
+	async def _run(self, channel_id: int):
+		while channel_id in self._pending:
+			if wait := self._wait_time(channel_id):
+				logger.debug("Delaying rename of %s by %.0f seconds", channel_id, wait)
+				await asyncio.sleep(wait)
+				continue
+
+			# Only the latest desired name is applied
+			vc, name = self._pending.pop(channel_id)
+			if vc.name == name:
+				continue
+
+			history = self._history.setdefault(channel_id, deque(maxlen=RENAME_LIMIT))
+			history.append(time.monotonic())
+			try:
+				await vc.edit(name=name)
+			except discord.NotFound:
+				self._pending.pop(channel_id, None)
+				self._history.pop(channel_id, None)
+				return
+			except discord.HTTPException as error:
+				logger.warning("Failed to rename %s to %s: %s", channel_id, name, error)
+
+
+class PresenceCoalescer:
+	"""
+	Per-channel coalescing queue for presence updates
+
+	The first event for a channel starts a short window, every event for
+	the same channel within that window is merged into it, and the
+	callback runs once when the window closes.
+	"""
+
+	def __init__(
+		self,
+		callback: Callable[[discord.VoiceChannel], Awaitable[None]],
+		window: float = 5,
+	):
+		self.callback = callback
+		self.window = window
+		self.stats: Counter[str] = Counter()
+		self._pending: dict[int, discord.VoiceChannel] = {}
+		self._tasks: set[asyncio.Task] = set()
+
+	def drop(self):
+		"""Count an event that was filtered out before reaching the queue"""
+		self.stats["dropped"] += 1
+
+	def submit(self, vc: discord.VoiceChannel):
+		if vc.id in self._pending:
+			self.stats["merged"] += 1
+			return
+		self._pending[vc.id] = vc
+		task = asyncio.create_task(self._flush(vc.id))
+		# Keep a reference, otherwise the task can be garbage collected
+		self._tasks.add(task)
+		task.add_done_callback(self._flush_done)
+
+	def _flush_done(self, task: asyncio.Task):
+		self._tasks.discard(task)
+		if not task.cancelled() and (error := task.exception()):
+			logger.error("Failed to process presence updates", exc_info=error)
+
+	async def _flush(self, channel_id: int):
+		await asyncio.sleep(self.window)
+		vc = self._pending.pop(channel_id)
+		self.stats["processed"] += 1
+		logger.debug(
+			"Processing presence updates of %s (%s dropped, %s merged, %s processed)",
+			channel_id,
+			self.stats["dropped"],
+			self.stats["merged"],
+			self.stats["processed"],
+		)
+		await self.callback(vc)
+
+
+def get_playing_games(member: discord.Member) -> frozenset[str]:
+	return frozenset(
+		activity.name
+		for activity in member.activities
+		if activity.type == discord.ActivityType.playing
+	)
+
+
+class ChannelTally:
+	"""Game counts of a single voice channel with a cached leader"""
+
+	def __init__(self):
+		self.counts: Counter[str] = Counter()
+		self.leader: str | None = None
+
+	def add(self, game: str):
+		self.counts[game] += 1
+		# On a tie the current leader stays, so the name doesn't flip-flop
+		if self.leader is None or self.counts[game] > self.counts[self.leader]:
+			self.leader = game
+
+	def remove(self, game: str):
+		self.counts[game] -= 1
+		if self.counts[game] <= 0:
+			del self.counts[game]
+		if game != self.leader:
+			return
+		if not self.counts:
+			self.leader = None
+			return
+		# Ties between the other games are broken alphabetically
+		best = min(self.counts, key=lambda name: (-self.counts[name], name))
+		if self.counts[best] > self.counts[game]:
+			self.leader = best
+
+
+class GameTally:
+	"""
+	Incrementally maintained game counts per voice channel
+
+	Updated from voice state and presence deltas, so the most played
+	game of a channel is a single lookup instead of a rescan of every
+	member's activities.
+	"""
+
+	def __init__(self):
+		self._channels: dict[int, ChannelTally] = {}
+		self._members: dict[tuple[int, int], tuple[int, frozenset[str]]] = {}
+
+	def most_played(self, channel_id: int) -> str | None:
+		tally = self._channels.get(channel_id)
+		return tally.leader if tally else None
+
+	def rebuild(self, channels: list[discord.VoiceChannel]):
+		self._channels.clear()
+		self._members.clear()
+		for vc in channels:
+			for member in vc.members:
+				self._add(member, vc.id, get_playing_games(member))
+
+	def update(self, member: discord.Member):
+		"""Sync a member's contribution with their current voice state and games"""
+		channel = member.voice.channel if member.voice else None
+		games = get_playing_games(member)
+		key = (member.guild.id, member.id)
+		if current := self._members.get(key):
+			if channel and current == (channel.id, games):
+				return
+			self._remove(key)
+		if channel:
+			self._add(member, channel.id, games)
+
+	def _add(self, member: discord.Member, channel_id: int, games: frozenset[str]):
+		self._members[member.guild.id, member.id] = (channel_id, games)
+		tally = self._channels.setdefault(channel_id, ChannelTally())
+		for game in sorted(games):
+			tally.add(game)
+
+	def _remove(self, key: tuple[int, int]):
+		channel_id, games = self._members.pop(key)
+		tally = self._channels[channel_id]
+		for game in games:
+			tally.remove(game)
+		if not tally.counts:
+			del self._channels[channel_id]
+
+
+RENAMES = RenameScheduler()
+GAMES = GameTally()
@@ -1,14 +1,12 @@
 import discord
 import wavelink
 
+from players import PLAYERS
+
 
 class MusicView(discord.ui.View):
 	async def setup_player(self, interaction: discord.Interaction) -> wavelink.Player:
-		player: wavelink.Player = interaction.guild.voice_client
-		if not player:
-			player = await interaction.user.voice.channel.connect(cls=wavelink.Player)
-		player.autoplay = wavelink.AutoPlayMode.partial
-		return player
+		return await PLAYERS.acquire(interaction.user.voice.channel)
 
 
 class AddBack(MusicView):
@@ -22,8 +20,7 @@ class AddBack(MusicView):
 	):
 		player = await self.setup_player(interaction)
 		await player.queue.put_wait(self.track)
-		if not player.playing:
-			await player.play(player.queue.get(), volume=30)
+		await PLAYERS.start(player)
 		await interaction.response.send_message("Added back")
 		button.disabled = True
 		await interaction.followup.edit_message(
@@ -32,22 +29,21 @@ class AddBack(MusicView):
 
 
 class RestoreQueue(MusicView):
-	def __init__(self, queue: wavelink.Queue):
+	def __init__(self, tracks: list[wavelink.Playable]):
 		super().__init__()
-		self.queue = queue
+		self.tracks = tracks
 
 	@discord.ui.button(label="Restore", style=discord.ButtonStyle.green, emoji="♻️")
 	async def restore(
 		self, button: discord.ui.Button, interaction: discord.Interaction
 	):
+		await interaction.response.defer()
 		player = await self.setup_player(interaction)
-		for track in self.queue:
-			await player.queue.put_wait(track)
-		if not player.playing:
-			await player.play(player.queue.get(), volume=30)
-		await interaction.response.send_message("Queue restored")
+		player.queue.put(self.tracks)
+		await PLAYERS.start(player)
 		button.disabled = True
-		await interaction.followup.edit_message(interaction.message.id, view=self)
+		await interaction.edit_original_response(view=self)
+		await interaction.followup.send("Queue restored")
 
 
 class StopPlayer(MusicView):
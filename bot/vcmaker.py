@@ -0,0 +1,104 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterable
+
+import httpx
+from pocketbase import PocketBaseError
+from pocketbase.models.dtos import RealtimeEvent, Record
+
+from generic import logger
+from pb import PB
+
+
+class VCMakerCache:
+	"""
+	In-memory write-through cache of the vcmaker collection
+
+	The whole table is loaded once and indexed by channel id, so voice
+	events can look up rows without a PocketBase round-trip. Writes go
+	to PocketBase and the cache at the same time, and a realtime
+	subscription picks up changes made outside of Bert.
+	"""
+
+	def __init__(self):
+		self._rows: dict[int, Record] = {}
+		self._unsubscribe: Callable[[], Awaitable[None]] | None = None
+
+	def get(self, channel_id: int, type_: str | None = None) -> Record | None:
+		"""Get the row of a channel, optionally only if it has the given type"""
+		row = self._rows.get(channel_id)
+		if row and type_ and row["type"] != type_:
+			return None
+		return row
+
+	def rows(self) -> list[Record]:
+		return list(self._rows.values())
+
+	async def load(self):
+		"""(Re)load the whole table from PocketBase"""
+		rows = await PB.collection("vcmaker").get_full_list()
+		self._rows = {int(row["channel"]): row for row in rows}
+		logger.debug("Loaded %s vcmaker rows", len(self._rows))
+
+	async def subscribe(self):
+		"""Keep the cache in sync with changes made outside of Bert"""
+		if self._unsubscribe:
+			return
+		self._unsubscribe = await PB.collection("vcmaker").subscribe_all(self._on_event)
+
+	async def _on_event(self, event: RealtimeEvent):
+		row = event["record"]
+		channel_id = int(row["channel"])
+		if event["action"] == "delete":
+			if (cached := self._rows.get(channel_id)) and cached["id"] == row["id"]:
+				del self._rows[channel_id]
+		else:
+			self._rows[channel_id] = row
+
+	async def create(
+		self, channel_id: int, type_: str, owner: int | None = None
+	) -> Record:
+		data = {"channel": str(channel_id), "type": type_}
+		if owner is not None:
+			data["owner"] = str(owner)
+		row = await PB.collection("vcmaker").create(data)
+		self._rows[channel_id] = row
+		return row
+
+	async def delete(self, channel_id: int) -> bool:
+		"""
+		Delete the row of a channel
+
+		The row is removed from the cache before the request is sent, so
+		concurrent events for the same channel only delete it once
+
+		Returns True if a row was deleted, False if there was none
+		"""
+		row = self._rows.pop(channel_id, None)
+		if not row:
+			return False
+		await PB.collection("vcmaker").delete(row["id"])
+		return True
+
+	async def delete_many(
+		self, channel_ids: Iterable[int], concurrency: int = 5
+	) -> int:
+		"""Delete the rows of several channels concurrently, returns how many were deleted"""
+		semaphore = asyncio.Semaphore(concurrency)
+
+		async def delete(channel_id: int) -> bool:
+			async with semaphore:
+				try:
+					return await self.delete(channel_id)
+				except (PocketBaseError, httpx.HTTPError) as error:
+					logger.warning(
+						"Failed to delete vcmaker row of %s: %s", channel_id, error
+					)
+					return False
+
+		results = await asyncio.gather(
+			*(delete(channel_id) for channel_id in channel_ids)
+		)
+		return sum(results)
+
+
+VCMAKER = VCMakerCache()
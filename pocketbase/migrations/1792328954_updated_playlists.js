@@ -0,0 +1,29 @@
+/// <reference path="../pb_data/types.d.ts" />
+migrate((db) => {
+  const dao = new Dao(db)
+  const collection = dao.findCollectionByNameOrId("81rl0tind69hrk6")
+
+  // add
+  collection.schema.addField(new SchemaField({
+    "system": false,
+    "id": "t9rk3sna",
+    "name": "tracks",
+    "type": "json",
+    "required": false,
+    "presentable": false,
+    "unique": false,
+    "options": {
+      "maxSize": 5000000
+    }
+  }))
+
+  return dao.saveCollection(collection)
+}, (db) => {
+  const dao = new Dao(db)
+  const collection = dao.findCollectionByNameOrId("81rl0tind69hrk6")
+
+  // remove
+  collection.schema.removeField("t9rk3sna")
+
+  return dao.saveCollection(collection)
+})